@@ -1,16 +1,38 @@
 # admin/handlers.py
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery, FSInputFile
+from aiogram.types import Message, CallbackQuery, BufferedInputFile, InputMediaPhoto
+from aiogram.filters import CommandStart, CommandObject
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
+from aiogram.exceptions import TelegramBadRequest
 from database import async_session
-from models import User, Admin,QRLog,AttendanceLog
-from utils.admin_check import is_admin, get_role
-from utils.misc import generate_qr, create_excel,export_attendance_excel
+from models import User, Admin,QRLog,AttendanceLog, BroadcastJob, DailyStat
+from utils.admin_check import invalidate_roles
+from utils.misc import render_qr, QR_BUNDLES
+from utils.exports import (
+    FORMATS, CachedExport, build_export, data_version,
+    get_cached_export, store_cached_export, get_watermark, save_watermark
+)
+from utils.broadcast import job_added
+from utils.executors import run_cpu
+from utils.stats import (
+    local_day, dashboard_cache, invalidate_dashboard,
+    period_range, year_ago, cashier_report_rows
+)
+from utils.cache import TTLCache
+from utils.charts import render_charts
+from config import TIMEZONE, TIMEZONE_NAME
+from utils.segments import segment_filters, segment_label, segment_count_query, parse_date_range
+from utils.search import search_users, parse_offset
+from utils.places import place_keys, place_name, place_exists, add_place, place_qr_file_id, set_qr_file_id
+from utils.attendance import mark_attendance, MarkResult
+from utils.outbox import outbox_added
+from utils.checkin import PREFIX as CHECKIN_PREFIX, verify_token
 from admin.keyboards import admin_main_keyboard, back_button, admin_list_keyboard
-from sqlalchemy import select, func, delete, cast, String, or_
+from sqlalchemy import select, func, delete, exists, or_, case
 from datetime import datetime, date, timedelta
-import os
+import re
+import time
 import asyncio
 from aiogram.types import InlineQueryResultArticle, InputTextMessageContent, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.types import InlineQuery
@@ -23,8 +45,11 @@ router = Router()
 class AdminStates(StatesGroup):
     broadcast = State()
     broadcast_message = State()
+    broadcast_range = State()
+    report_range = State()
     qr_key = State()
     cashier_search = State()
+    bulk_checkin = State()
 
 class SuperAdminStates(StatesGroup):
     waiting_admin_id = State()
@@ -32,91 +57,182 @@ class SuperAdminStates(StatesGroup):
     waiting_remove_admin = State()
 
 
-def _personalized_block(first_name, base_text: str) -> str:
-    name = first_name or "do'stimiz"
-    greeting = f"👋 Salom, {name}!"
-    return f"{greeting}\n\n{base_text}" if base_text else greeting
+def _resolve_accessible_places(role: str | None, admin_place: str | None) -> list[str]:
+    if role == "cashier" and admin_place:
+        return [admin_place]
+    return place_keys()
 
 
-async def _resolve_accessible_places(session, admin_record):
-    if admin_record and admin_record.role == "cashier" and admin_record.place:
-        return [admin_record.place]
-    result = await session.execute(select(QRLog.source_key))
-    return [row[0] for row in result.all()]
+# Davomat tugmalarida: ro'yxat qurilmaydi, faqat lug'atdan tekshiriladi
+def _place_allowed(role: str | None, admin_place: str | None, place: str) -> bool:
+    if role == "cashier" and admin_place:
+        return place == admin_place
+    return place_exists(place)
 
 
-async def _mark_attendance(session, user, place: str, marker_id: int) -> datetime:
-    now = datetime.utcnow()
-    log = AttendanceLog(
-        user_id=user.telegram_id,
-        place=place,
-        marked_by=marker_id
-    )
-    user.attended = True
-    user.attended_date = now
-    session.add(log)
+async def _mark_attendance(session, condition, place: str, marker_id: int) -> list[MarkResult]:
+    marks = await mark_attendance(session, condition, place, marker_id)
     await session.commit()
-    return now
-
-
-async def _notify_attendance(bot, user, place: str, marked_at: datetime):
-    formatted_time = marked_at.strftime("%Y-%m-%d %H:%M:%S")
-    await bot.send_message(
-        chat_id=user.telegram_id,
-        text=(
-            f"👋 Salom, {user.first_name}!\n\n"
-            f"✅ Siz muvaffaqiyatli ravishda quyidagi joyga keldingiz:\n"
-            f"🏢 Joy: <b>{place}</b>\n"
-            f"🕒 Vaqt: <b>{formatted_time}</b>\n\n"
-            f"Rahmat!"
-        ),
-        parse_mode="HTML"
-    )
+    if any(mark.created for mark in marks):
+        invalidate_dashboard()
+        # Xabarlar outbox orqali fonda yuboriladi
+        outbox_added.set()
+    return marks
+
+
+SEGMENT_FIELDS = {
+    "gender": "Jinsi",
+    "source": "Manba",
+    "attended": "Kelganlik",
+    "registered": "Ro'yxatdan o'tgan sana",
+    "place": "Oxirgi tashrif joyi"
+}
+
+
+def _segment_keyboard() -> InlineKeyboardMarkup:
+    kb = [
+        [InlineKeyboardButton(text=label, callback_data=f"seg_menu:{field}")]
+        for field, label in SEGMENT_FIELDS.items()
+    ]
+    kb.append([
+        InlineKeyboardButton(text="🔄 Tozalash", callback_data="seg_reset"),
+        InlineKeyboardButton(text="Davom etish ➡️", callback_data="seg_done")
+    ])
+    kb.append([InlineKeyboardButton(text="Orqaga", callback_data="admin_main")])
+    return InlineKeyboardMarkup(inline_keyboard=kb)
+
+
+async def _segment_options(session, field: str) -> list[tuple[str, str]]:
+    if field == "gender":
+        return [("Erkaklar", "male"), ("Ayollar", "female")]
+    if field == "attended":
+        return [("Kelganlar", "yes"), ("Hech kelmaganlar", "no")]
+    if field == "registered":
+        return [
+            ("Oxirgi 7 kun", "7"), ("Oxirgi 30 kun", "30"),
+            ("Oxirgi 90 kun", "90"), ("Oraliq kiritish", "range")
+        ]
+    if field == "source":
+        result = await session.execute(
+            select(User.source).group_by(User.source).order_by(func.count(User.id).desc()).limit(20)
+        )
+        return [(src, src) for (src,) in result.all() if src]
+    if field == "place":
+        return [(place_name(key), key) for key in sorted(place_keys())]
+    return []
 
 
-def _broadcast_target_keyboard() -> InlineKeyboardMarkup:
-    return InlineKeyboardMarkup(
-        inline_keyboard=[
-            [InlineKeyboardButton(text="Hamma", callback_data="broadcast_target:all")],
-            [InlineKeyboardButton(text="Faqat erkaklar", callback_data="broadcast_target:male")],
-            [InlineKeyboardButton(text="Faqat ayollar", callback_data="broadcast_target:female")],
-            [InlineKeyboardButton(text="Orqaga", callback_data="admin_main")]
-        ]
+async def _segment_text(segment: dict) -> str:
+    async with async_session() as session:
+        count = await session.scalar(segment_count_query(segment))
+    return (
+        f"<b>Broadcast segmenti</b>\n\n"
+        f"Segment: {segment_label(segment)}\n"
+        f"Qabul qiluvchilar: <b>{count}</b> ta\n\n"
+        f"Filtr qo'shing yoki davom eting:"
     )
 
 
-async def _find_user_by_identifier(session, identifier: str):
-    value = identifier.strip()
-    user = None
+USERNAME_RE = re.compile(r"^[A-Za-z][A-Za-z0-9_]{3,31}$")
 
+
+def _identifier_conditions(identifier: str) -> list:
+    # (shart, ustuvorlik) — identifikator oldindan turi bo'yicha ajratiladi
+    value = identifier.strip()
     if value.startswith("@"):
-        username = value[1:]
-        if username:
-            user = await session.scalar(
-                select(User).where(func.lower(User.username) == username.lower())
-            )
+        username = value[1:].lower()
+        return [(func.lower(User.username) == username, 0)] if username else []
+
+    if USERNAME_RE.match(value):
+        return [(func.lower(User.username) == value.lower(), 0)]
 
-    if user is None and value.isdigit():
+    conditions = []
+    if value.isdigit() and len(value) <= 18:
         numeric_value = int(value)
-        user = await session.scalar(select(User).where(User.telegram_id == numeric_value))
-        if user is None:
-            user = await session.scalar(select(User).where(User.id == numeric_value))
+        conditions += [(User.telegram_id == numeric_value, 1), (User.id == numeric_value, 2)]
+
+    digits = "".join(ch for ch in value if ch.isdigit())
+    if digits:
+        conditions.append((User.phone == digits, 3))
+    return conditions
+
+
+async def _find_user_by_identifier(session, identifier: str):
+    conditions = _identifier_conditions(identifier)
+    if not conditions:
+        return None
+    # Bitta so'rov: mos kelganlar ichidan eng ustuvori
+    return await session.scalar(
+        select(User)
+        .where(or_(*[condition for condition, _ in conditions]))
+        .order_by(case(*conditions))
+        .limit(1)
+    )
+
+
+# ---------- Shaxsiy check-in QR: imzo tekshiriladi, users.id bo'yicha darhol belgilanadi ----------
+# Holat (FSM) handlerlaridan oldin ro'yxatdan o'tadi — aks holda "/start ci_..." matn sifatida ushlanadi
+async def _checkin_reply(message: Message, user_id: int, place: str, marker_id: int):
+    async with async_session() as session:
+        marks = await _mark_attendance(session, User.id == user_id, place, marker_id)
+
+    if not marks:
+        return await message.answer("Foydalanuvchi topilmadi.")
+    mark = marks[0]
+    if mark.created:
+        await message.answer(f"✅ {mark.first_name} — {place} joyida belgilandi.")
+    else:
+        await message.answer(f"{mark.first_name} bugun {place} joyida allaqachon belgilangan.")
+
+
+@router.message(CommandStart(deep_link=True, magic=F.args.startswith(CHECKIN_PREFIX)))
+async def checkin_scan(message: Message, command: CommandObject, state: FSMContext,
+                       role: str, admin_place: str | None):
+    if role == "user":
+        return await message.answer("Bu QR kod kassada skanerlanadi. Uni kassirga ko‘rsating.")
+
+    user_id = verify_token(command.args)
+    if user_id is None:
+        return await message.answer("QR kod yaroqsiz.")
+
+    # Guruh rejimida skanlar ro'yxatga qo'shiladi; qolgan kassa/QR holatlari skan bilan yopiladi
+    current = await state.get_state()
+    if current == AdminStates.bulk_checkin.state:
+        return await bulk_collect(message, state)
+    if current in (AdminStates.cashier_search.state, AdminStates.qr_key.state):
+        await state.clear()
+
+    places = _resolve_accessible_places(role, admin_place)
+    if not places:
+        return await message.answer("Sizga joy biriktirilmagan. SuperAdmin bilan bog'laning.")
+    if len(places) == 1:
+        return await _checkin_reply(message, user_id, places[0], message.from_user.id)
+
+    await message.answer(
+        "Qaysi joyda belgilaymiz?",
+        reply_markup=InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text=place_name(place), callback_data=f"ci_place:{user_id}:{place}")]
+            for place in places
+        ])
+    )
 
-    if user is None:
-        digits = "".join(ch for ch in value if ch.isdigit())
-        if digits:
-            user = await session.scalar(select(User).where(User.phone == digits))
 
-    return user
+@router.callback_query(F.data.startswith("ci_place:"))
+async def checkin_place(call: CallbackQuery, role: str, admin_place: str | None):
+    _, user_id, place = call.data.split(":", 2)
+    if not _place_allowed(role, admin_place, place):
+        return await call.answer("Bu joy sizga biriktirilmagan!", show_alert=True)
+
+    await call.answer()
+    await _checkin_reply(call.message, int(user_id), place, call.from_user.id)
 
 
 # ====================== ADMIN PANEL KIRISH ======================
 @router.message(F.text == "/admin")
-async def admin_panel(message: Message):
-    if not await is_admin(message.from_user.id):
+async def admin_panel(message: Message, role: str):
+    if role == "user":
         return await message.answer("Siz admin emassiz!")
 
-    role = await get_role(message.from_user.id)
     text = f"Admin panel\n\nRolingiz: <b>{role.upper()}</b>"
 
     await message.answer(
@@ -126,23 +242,34 @@ async def admin_panel(message: Message):
 
 
 # ====================== STATISTIKA ======================
-@router.callback_query(F.data == "admin_stats")
-async def admin_stats(call: CallbackQuery):
-    today = date.today()
+async def _load_stats():
+    today = local_day()
     async with async_session() as session:
-        total = await session.scalar(select(func.count(User.id)))
-        today_count = await session.scalar(
-            select(func.count(User.id)).where(func.date(User.attended_date) == today)
-        )
+        total = await session.scalar(select(func.coalesce(func.sum(DailyStat.registrations), 0)))
+        today_row = (await session.execute(
+            select(
+                func.coalesce(func.sum(DailyStat.registrations), 0),
+                func.coalesce(func.sum(DailyStat.visits), 0)
+            ).where(DailyStat.day == today)
+        )).one()
         sources_result = await session.execute(
-            select(User.source, func.count(User.id))
-            .group_by(User.source)
+            select(DailyStat.source, func.sum(DailyStat.registrations))
+            .where(DailyStat.place == "")
+            .group_by(DailyStat.source)
+            .order_by(func.sum(DailyStat.registrations).desc())
         )
-        sources = sources_result.all()
+        return total, tuple(today_row), sources_result.all()
+
 
+@router.callback_query(F.data == "admin_stats")
+async def admin_stats(call: CallbackQuery):
+    total, today_row, sources = await dashboard_cache.get_or_load(("stats", local_day()), _load_stats)
+
+    today_registered, today_visits = today_row
     text = f"<b>Foydalanuvchi statistikasi</b>\n\n" \
            f"Jami foydalanuvchilar: <b>{total}</b>\n" \
-           f"Bugun kelganlar: <b>{today_count}</b>\n\n" \
+           f"Bugun ro'yxatdan o'tganlar: <b>{today_registered}</b>\n" \
+           f"Bugungi tashriflar: <b>{today_visits}</b>\n\n" \
            f"Manbalar bo'yicha:\n"
 
     if sources:
@@ -152,109 +279,358 @@ async def admin_stats(call: CallbackQuery):
     else:
         text += "└ Ma'lumot yo'q"
 
+    text += f"\n\n<i>Kesh: {dashboard_cache.stats()}</i>"
     await call.message.edit_text(text, reply_markup=back_button())
 
 
-# ====================== EXCEL EXPORT ======================
-@router.callback_query(F.data == "admin_export")
-async def admin_export(call: CallbackQuery):
-    role = await get_role(call.from_user.id)
-    if role not in ("admin", "superadmin"):
+# ====================== GRAFIKLAR ======================
+CHART_RANGES = {"7": "Oxirgi 7 kun", "30": "Oxirgi 30 kun", "90": "Oxirgi 90 kun"}
+
+# (boshlanish kuni, kunlar soni) -> [heatmap file_id, trend file_id]
+# Oraliq kechagi kun bilan tugaydi, shuning uchun kun davomida o'zgarmaydi
+chart_cache = TTLCache(maxsize=32, ttl=24 * 3600)
+
+
+@router.callback_query(F.data == "admin_charts")
+async def admin_charts(call: CallbackQuery, role: str):
+    if role not in ("analyst", "admin", "superadmin"):
         return await call.answer("Sizda ruxsat yo'q!", show_alert=True)
 
+    kb = [
+        [InlineKeyboardButton(text=label, callback_data=f"charts:{days}")]
+        for days, label in CHART_RANGES.items()
+    ]
+    kb.append([InlineKeyboardButton(text="Orqaga", callback_data="admin_main")])
+    await call.message.edit_text(
+        "<b>Grafiklar</b>\n\nDavrni tanlang (bugungi kun kirmaydi):",
+        reply_markup=InlineKeyboardMarkup(inline_keyboard=kb)
+    )
+
+
+@router.callback_query(F.data.startswith("charts:"))
+async def admin_charts_render(call: CallbackQuery, role: str):
+    if role not in ("analyst", "admin", "superadmin"):
+        return await call.answer("Sizda ruxsat yo'q!", show_alert=True)
+
+    days = int(call.data.split(":", 1)[1])
+    end = local_day()
+    start = end - timedelta(days=days)
+    key = (start, days)
+
+    file_ids = chart_cache.get(key)
+    if file_ids is not None:
+        await call.answer()
+        await call.message.answer_media_group([InputMediaPhoto(media=fid) for fid in file_ids])
+        return
+
+    await call.answer("Grafiklar tayyorlanmoqda...")
+    start_dt = datetime.combine(start, datetime.min.time(), tzinfo=TIMEZONE)
+    end_dt = datetime.combine(end, datetime.min.time(), tzinfo=TIMEZONE)
     async with async_session() as session:
-        users = await session.execute(select(User))
-        users = users.scalars().all()
+        result = await session.stream(
+            select(AttendanceLog.place, AttendanceLog.marked_at)
+            .where(AttendanceLog.marked_at >= start_dt, AttendanceLog.marked_at < end_dt)
+            .execution_options(yield_per=5000)
+        )
+        rows = [tuple(row) async for row in result]
 
-    file_path = create_excel(
-        users,
-        headers=["ID", "Telegram ID", "Ism", "Username", "Telefon", "Source", "Ro'yxatdan o'tgan"]
-    )
+    if not rows:
+        return await call.message.answer("Bu davrda tashriflar yo'q.")
 
-    await call.message.delete()
-    await call.message.answer_document(
-        FSInputFile(file_path),
-        caption=f"Foydalanuvchilar soni: {len(users)}"
+    heatmap, trend = await run_cpu(render_charts, rows, start, days, TIMEZONE_NAME)
+    sent = await call.message.answer_media_group([
+        InputMediaPhoto(media=BufferedInputFile(heatmap, filename="heatmap.png")),
+        InputMediaPhoto(media=BufferedInputFile(trend, filename="trend.png"))
+    ])
+    chart_cache.set(key, [msg.photo[-1].file_id for msg in sent])
+
+
+# ====================== EXPORT ======================
+EXPORT_KINDS = {"admin_export": "users", "admin_export_2": "attendance"}
+EXPORT_TITLES = {"users": "Foydalanuvchilar", "attendance": "Davomat"}
+
+
+def _export_keyboard(kind: str) -> InlineKeyboardMarkup:
+    kb = [
+        [
+            InlineKeyboardButton(text=label, callback_data=f"export:{kind}:{fmt}:full"),
+            InlineKeyboardButton(text=f"{label} — yangilari", callback_data=f"export:{kind}:{fmt}:delta")
+        ]
+        for fmt, label in FORMATS.items()
+    ]
+    kb.append([InlineKeyboardButton(text="Orqaga", callback_data="admin_main")])
+    return InlineKeyboardMarkup(inline_keyboard=kb)
+
+
+@router.callback_query(F.data.in_(EXPORT_KINDS))
+async def admin_export(call: CallbackQuery, role: str):
+    if role not in ("admin", "superadmin"):
+        return await call.answer("Sizda ruxsat yo'q!", show_alert=True)
+
+    kind = EXPORT_KINDS[call.data]
+    await call.message.edit_text(
+        f"<b>{EXPORT_TITLES[kind]}</b> eksporti\n\n"
+        "Formatni tanlang. «Yangilari» — oxirgi eksportingizdan keyin qo'shilgan yozuvlar.",
+        reply_markup=_export_keyboard(kind)
     )
-    os.remove(file_path)
 
-@router.callback_query(F.data == "admin_export_2")
-async def admin_export(call: CallbackQuery):
-    role = await get_role(call.from_user.id)
+
+@router.callback_query(F.data.startswith("export:"))
+async def admin_export_run(call: CallbackQuery, role: str):
     if role not in ("admin", "superadmin"):
         return await call.answer("Sizda ruxsat yo'q!", show_alert=True)
 
-    file_path = await export_attendance_excel(async_session)
+    _, kind, fmt, mode = call.data.split(":")
+    if kind not in EXPORT_TITLES or fmt not in FORMATS:
+        return await call.answer("Noma'lum format", show_alert=True)
 
-    await call.message.delete()
-    await call.message.answer_document(
-        FSInputFile(file_path),
-        caption="Attendance ro'yxati"
-    )
-    os.remove(file_path)
+    async with async_session() as session:
+        after_id = await get_watermark(session, call.from_user.id, kind) if mode == "delta" else 0
+        version = await data_version(session, kind)
+
+    if after_id and after_id >= version:
+        return await call.answer("Yangi yozuvlar yo'q.", show_alert=True)
+
+    caption_suffix = " (oxirgi eksportdan beri)" if after_id else ""
+    cached = get_cached_export(kind, fmt, after_id, version)
+    if cached is not None:
+        # Xuddi shu ma'lumot allaqachon yuklangan — Telegram file_id qayta ishlatiladi
+        await call.answer()
+        await call.message.delete()
+        await call.message.answer_document(
+            cached.file_id,
+            caption=f"{EXPORT_TITLES[kind]}: {cached.count} ta{caption_suffix}"
+        )
+        last_id = cached.last_id
+    else:
+        await call.answer("Fayl tayyorlanmoqda...")
+        result = await build_export(async_session, kind, fmt, after_id)
+        if not result.count:
+            return await call.message.answer("Yangi yozuvlar yo'q.")
+
+        await call.message.delete()
+        sent = await call.message.answer_document(
+            BufferedInputFile(result.data, filename=result.filename),
+            caption=f"{EXPORT_TITLES[kind]}: {result.count} ta{caption_suffix}"
+        )
+        store_cached_export(
+            kind, fmt, after_id,
+            CachedExport(version, sent.document.file_id, result.count, result.last_id)
+        )
+        last_id = result.last_id
+
+    async with async_session() as session:
+        await save_watermark(session, call.from_user.id, kind, last_id)
+        await session.commit()
+
+
+REPORT_PERIODS = {"day": "Bugun", "week": "Shu hafta", "month": "Shu oy", "year": "Shu yil"}
+REPORT_GROUPS = {"cashier": "Kassirlar", "place": "Joylar"}
+
+
+def _report_keyboard(group: str) -> InlineKeyboardMarkup:
+    other = "place" if group == "cashier" else "cashier"
+    kb = [
+        [
+            InlineKeyboardButton(text=label, callback_data=f"creport:{period}:{group}")
+            for period, label in list(REPORT_PERIODS.items())[i:i + 2]
+        ]
+        for i in range(0, len(REPORT_PERIODS), 2)
+    ]
+    kb.append([InlineKeyboardButton(text="Oraliq kiritish", callback_data=f"creport_range:{group}")])
+    kb.append([InlineKeyboardButton(text=f"{REPORT_GROUPS[other]} bo'yicha", callback_data=f"creport_group:{other}")])
+    kb.append([InlineKeyboardButton(text="Orqaga", callback_data="admin_main")])
+    return InlineKeyboardMarkup(inline_keyboard=kb)
+
+
+def _change(current: int, previous: int) -> str:
+    if not previous:
+        return "yangi" if current else "0%"
+    return f"{(current - previous) / previous * 100:+.0f}%"
+
+
+async def _report_text(start: date, end: date, group: str) -> str:
+    # Rollup bo'yicha: joriy davr va o'tgan yilning xuddi shu davri
+    async def load():
+        async with async_session() as session:
+            current = await cashier_report_rows(session, start, end, group)
+            previous = await cashier_report_rows(session, year_ago(start), year_ago(end), group)
+        return current, previous
+
+    current, previous = await dashboard_cache.get_or_load(("cashier_report", start, end, group), load)
+    last_year = {key: total for key, _, total in previous}
+    total_now = sum(total for _, _, total in current)
+    total_prev = sum(last_year.values())
+
+    last_day = end - timedelta(days=1)
+    text = [
+        f"<b>{REPORT_GROUPS[group]} hisoboti</b>",
+        f"Davr: {start.strftime('%d.%m.%Y')} - {last_day.strftime('%d.%m.%Y')}",
+        f"Jami: <b>{total_now}</b> ta (o'tgan yil: {total_prev}, {_change(total_now, total_prev)})",
+        ""
+    ]
+    if not current:
+        text.append("Bu davrda ma'lumot yo'q.")
+    for idx, (key, full_name, total) in enumerate(current, 1):
+        if group == "place":
+            name = key
+        else:
+            name = f"{full_name or 'Ism kiritilmagan'} ({key})"
+        prev = last_year.get(key, 0)
+        text.append(f"{idx}. {name} — {total} ta | o'tgan yil: {prev} ({_change(total, prev)})")
+    return "\n".join(text)
 
 
 @router.callback_query(F.data == "cashier_report")
-async def cashier_report(call: CallbackQuery):
-    role = await get_role(call.from_user.id)
+async def cashier_report(call: CallbackQuery, state: FSMContext, role: str):
     if role not in ("admin", "superadmin", "analyst"):
         return await call.answer("Sizda ruxsat yo'q!", show_alert=True)
 
-    today = datetime.utcnow().date()
-    period_start = today.replace(day=1)
-    next_month = (period_start + timedelta(days=32)).replace(day=1)
-    start_dt = datetime.combine(period_start, datetime.min.time())
-    end_dt = datetime.combine(next_month, datetime.min.time())
+    await state.clear()
+    start, end = period_range("month")
+    await call.message.edit_text(await _report_text(start, end, "cashier"), reply_markup=_report_keyboard("cashier"))
 
-    async with async_session() as session:
-        result = await session.execute(
-            select(
-                AttendanceLog.marked_by,
-                func.count(AttendanceLog.id).label("total"),
-                Admin.full_name,
-                Admin.place
-            )
-            .join(Admin, Admin.telegram_id == AttendanceLog.marked_by, isouter=True)
-            .where(AttendanceLog.marked_at >= start_dt, AttendanceLog.marked_at < end_dt)
-            .group_by(AttendanceLog.marked_by, Admin.full_name, Admin.place)
-            .order_by(func.count(AttendanceLog.id).desc())
-        )
-        rows = result.all()
 
-    if not rows:
-        return await call.answer("Bu oyda hali ma'lumot yo'q.", show_alert=True)
+@router.callback_query(F.data.startswith("creport_group:"))
+async def cashier_report_group(call: CallbackQuery, role: str):
+    if role not in ("admin", "superadmin", "analyst"):
+        return await call.answer("Sizda ruxsat yo'q!", show_alert=True)
+
+    group = call.data.split(":", 1)[1]
+    start, end = period_range("month")
+    await call.message.edit_text(await _report_text(start, end, group), reply_markup=_report_keyboard(group))
+
+
+@router.callback_query(F.data.startswith("creport:"))
+async def cashier_report_period(call: CallbackQuery, role: str):
+    if role not in ("admin", "superadmin", "analyst"):
+        return await call.answer("Sizda ruxsat yo'q!", show_alert=True)
+
+    _, period, group = call.data.split(":")
+    start, end = period_range(period)
+    try:
+        await call.message.edit_text(await _report_text(start, end, group), reply_markup=_report_keyboard(group))
+    except TelegramBadRequest:
+        await call.answer()
+
+
+@router.callback_query(F.data.startswith("creport_range:"))
+async def cashier_report_range_start(call: CallbackQuery, state: FSMContext, role: str):
+    if role not in ("admin", "superadmin", "analyst"):
+        return await call.answer("Sizda ruxsat yo'q!", show_alert=True)
+
+    await state.update_data(report_group=call.data.split(":", 1)[1])
+    await state.set_state(AdminStates.report_range)
+    await call.message.edit_text(
+        "Sanalar oralig'ini yuboring (masalan: 01.09.2025-30.09.2025):",
+        reply_markup=back_button("cashier_report")
+    )
 
-    month_label = period_start.strftime("%B %Y")
-    text = [f"<b>{month_label}</b> bo'yicha kassirlar hisobot:"]
-    for idx, row in enumerate(rows, 1):
-        marked_by, total, full_name, place = row
-        name = full_name or "Ism kiritilmagan"
-        place_part = f" | Joy: {place}" if place else ""
-        text.append(f"{idx}. {name} ({marked_by}) — {total} ta{place_part}")
 
-    text.append("\nHisobot hozirgi oyni qamrab oladi.")
-    await call.message.edit_text("\n".join(text), reply_markup=back_button())
+@router.message(AdminStates.report_range)
+async def cashier_report_range(message: Message, state: FSMContext):
+    days = parse_date_range(message.text or "")
+    if not days:
+        return await message.answer("Sana formati noto'g'ri. Masalan: 01.09.2025-30.09.2025")
+
+    group = (await state.get_data()).get("report_group", "cashier")
+    await state.clear()
+    start, end = days[0], days[1] + timedelta(days=1)
+    await message.answer(await _report_text(start, end, group), reply_markup=_report_keyboard(group))
 
 
 # ====================== BROADCAST (SMM + SuperAdmin) ======================
 @router.callback_query(F.data == "admin_broadcast")
-async def broadcast_start(call: CallbackQuery, state: FSMContext):
-    role = await get_role(call.from_user.id)
+async def broadcast_start(call: CallbackQuery, state: FSMContext, role: str):
     if role not in ("smm", "superadmin"):
         return await call.answer("Faqat SMM va SuperAdmin yubora oladi!", show_alert=True)
 
+    await state.set_state(AdminStates.broadcast)
+    await state.update_data(broadcast_segment={})
+    await call.message.edit_text(await _segment_text({}), reply_markup=_segment_keyboard())
+
+
+@router.callback_query(AdminStates.broadcast, F.data.startswith("seg_menu:"))
+async def broadcast_segment_menu(call: CallbackQuery, state: FSMContext):
+    field = call.data.split(":", 1)[1]
+    async with async_session() as session:
+        options = await _segment_options(session, field)
+
+    await state.update_data(segment_field=field, segment_options=[value for _, value in options])
+    kb = [
+        [InlineKeyboardButton(text=text, callback_data=f"seg_set:{idx}")]
+        for idx, (text, _) in enumerate(options)
+    ]
+    kb.append([InlineKeyboardButton(text="Farqi yo'q", callback_data="seg_set:clear")])
     await call.message.edit_text(
-        "Xabar kimlarga yuboriladi?",
-        reply_markup=_broadcast_target_keyboard()
+        f"<b>{SEGMENT_FIELDS.get(field, field)}</b> bo'yicha tanlang:",
+        reply_markup=InlineKeyboardMarkup(inline_keyboard=kb)
     )
+
+
+@router.callback_query(AdminStates.broadcast, F.data.startswith("seg_set:"))
+async def broadcast_segment_set(call: CallbackQuery, state: FSMContext):
+    data = await state.get_data()
+    field = data.get("segment_field")
+    options = data.get("segment_options") or []
+    segment = dict(data.get("broadcast_segment") or {})
+    choice = call.data.split(":", 1)[1]
+
+    keys = ("reg_from", "reg_to") if field == "registered" else (field,)
+    for key in keys:
+        segment.pop(key, None)
+
+    if choice != "clear":
+        value = options[int(choice)]
+        if field == "registered" and value == "range":
+            await state.set_state(AdminStates.broadcast_range)
+            await call.message.edit_text(
+                "Sanalar oralig'ini yuboring (masalan: 01.09.2025-30.09.2025):",
+                reply_markup=back_button("admin_broadcast")
+            )
+            return
+        if field == "registered":
+            segment["reg_from"] = (local_day() - timedelta(days=int(value))).isoformat()
+        else:
+            segment[field] = value
+
+    await state.update_data(broadcast_segment=segment)
+    await call.message.edit_text(await _segment_text(segment), reply_markup=_segment_keyboard())
+
+
+@router.message(AdminStates.broadcast_range)
+async def broadcast_segment_range(message: Message, state: FSMContext):
+    days = parse_date_range(message.text or "")
+    if not days:
+        return await message.answer("Sana formati noto'g'ri. Masalan: 01.09.2025-30.09.2025")
+
+    data = await state.get_data()
+    segment = dict(data.get("broadcast_segment") or {})
+    segment["reg_from"], segment["reg_to"] = days[0].isoformat(), days[1].isoformat()
+    await state.update_data(broadcast_segment=segment)
     await state.set_state(AdminStates.broadcast)
+    await message.answer(await _segment_text(segment), reply_markup=_segment_keyboard())
+
 
+@router.callback_query(AdminStates.broadcast, F.data == "seg_reset")
+async def broadcast_segment_reset(call: CallbackQuery, state: FSMContext):
+    await state.update_data(broadcast_segment={})
+    await call.message.edit_text(await _segment_text({}), reply_markup=_segment_keyboard())
+
+
+@router.callback_query(AdminStates.broadcast, F.data == "seg_done")
+async def broadcast_segment_done(call: CallbackQuery, state: FSMContext):
+    data = await state.get_data()
+    segment = data.get("broadcast_segment") or {}
+    async with async_session() as session:
+        count = await session.scalar(segment_count_query(segment))
+
+    if not count:
+        return await call.answer("Tanlangan toifadagi foydalanuvchilar topilmadi.", show_alert=True)
 
-@router.callback_query(AdminStates.broadcast, F.data.startswith("broadcast_target:"))
-async def broadcast_target_selected(call: CallbackQuery, state: FSMContext):
-    target = call.data.split(":")[1]
-    await state.update_data(broadcast_target=target)
     await call.message.edit_text(
+        f"Segment: {segment_label(segment)}\n"
+        f"Qabul qiluvchilar: <b>{count}</b> ta\n\n"
         "Reklama xabarini yuboring (foto, video, matn):",
         reply_markup=back_button()
     )
@@ -264,87 +640,99 @@ async def broadcast_target_selected(call: CallbackQuery, state: FSMContext):
 @router.message(AdminStates.broadcast_message)
 async def broadcast_send(message: Message, state: FSMContext):
     data = await state.get_data()
-    target = data.get("broadcast_target", "all")
+    segment = data.get("broadcast_segment") or {}
+
+    if message.content_type == "text":
+        base_text = message.html_text or message.text or ""
+    else:
+        base_text = message.html_caption or message.caption or ""
 
     async with async_session() as session:
-        stmt = select(User.telegram_id, User.first_name)
-        if target in ("male", "female"):
-            stmt = stmt.where(User.gender == target)
-        result = await session.execute(stmt)
-        receivers = result.all()
-
-    if not receivers:
-        await message.answer("Tanlangan toifadagi foydalanuvchilar topilmadi.")
-        await state.clear()
-        return
+        has_receivers = await session.scalar(
+            select(exists().where(*segment_filters(segment)).select_from(User))
+        )
+        if not has_receivers:
+            await message.answer("Tanlangan toifadagi foydalanuvchilar topilmadi.")
+            await state.clear()
+            return
 
-    sent = 0
-    blocked = 0
-    for uid, first_name in receivers:
-        try:
-            if message.content_type == "text":
-                base_text = message.html_text or message.text or ""
-                text = _personalized_block(first_name, base_text)
-                await message.bot.send_message(uid, text, parse_mode="HTML")
-            else:
-                base_caption = message.html_caption or message.caption or ""
-                caption = _personalized_block(first_name, base_caption)
-                await message.copy_to(uid, caption=caption, parse_mode="HTML")
-            sent += 1
-        except Exception:
-            blocked += 1
-        await asyncio.sleep(0.05)
-
-    target_label = {
-        "all": "Hamma",
-        "male": "Erkaklar",
-        "female": "Ayollar"
-    }.get(target, target)
-
-    await message.answer(f"Yuborildi: {sent} ta\nBloklagan: {blocked} ta\nSegment: {target_label}")
+        job = BroadcastJob(
+            created_by=message.from_user.id,
+            segment=segment,
+            content_type=message.content_type,
+            text=base_text,
+            source_chat_id=message.chat.id,
+            source_message_id=message.message_id
+        )
+        session.add(job)
+        await session.flush()
+
+        progress = await message.answer(
+            f"<b>Broadcast #{job.id}</b> navbatga qo'yildi.\n"
+            f"Segment: {segment_label(segment)}"
+        )
+        job.progress_chat_id = progress.chat.id
+        job.progress_message_id = progress.message_id
+        await session.commit()
+
+    job_added.set()
     await state.clear()
 
 
 # ====================== QR GENERATOR (faqat SuperAdmin) ======================
 @router.callback_query(F.data == "admin_qr")
-async def qr_start(call: CallbackQuery, state: FSMContext):
-    if await get_role(call.from_user.id) != "superadmin":
+async def qr_start(call: CallbackQuery, state: FSMContext, role: str):
+    if role != "superadmin":
         return await call.answer("Faqat SuperAdmin!", show_alert=True)
     
 
-    async with async_session() as session:
-        qr_codes = await session.execute(select(QRLog))
-        qr_code = qr_codes.scalars().all()
-
-    if qr_code:
+    places = place_keys()
+    if places:
         text = "<b>Mavjud QR kodlar:</b>\n\n";k=1
-        for qr in qr_code:
-            text += f"{k}. <b>{qr.source_key}</b>\n"
+        for key in places:
+            text += f"{k}. <b>{key}</b>\n"
             k += 1
     else:
         text = "Hozircha QR kodlar mavjud emas."
 
     await call.message.edit_text(
         f"{text}\n\n"
-        "QR kod uchun kalit yuboring (masalan: ice_city):",
-        reply_markup=back_button()
+        "QR kod uchun kalit yuboring (masalan: ice_city)\n"
+        "yoki mavjud joy QR kodini qayta ko'rish uchun tanlang:",
+        reply_markup=InlineKeyboardMarkup(inline_keyboard=[
+            *[[InlineKeyboardButton(text=f"🔳 {key}", callback_data=f"qr_show:{key}")] for key in places],
+            *([[
+                InlineKeyboardButton(text="📦 Hammasi (ZIP)", callback_data="qr_batch:zip"),
+                InlineKeyboardButton(text="🖨 Hammasi (PDF)", callback_data="qr_batch:pdf")
+            ]] if places else []),
+            [InlineKeyboardButton(text="Orqaga", callback_data="admin_main")]
+        ])
     )
     
     await state.set_state(AdminStates.qr_key)
 
 
-@router.message(AdminStates.qr_key)
-async def qr_generate(message: Message, state: FSMContext):
-    key = message.text.strip().lower()
+async def _send_place_qr(message: Message, key: str):
     bot = await message.bot.get_me()
     link = f"https://t.me/{bot.username}?start={key}"
-    file = generate_qr(link)
+    caption = f"<b>{key.upper()}</b>\n\n{link}"
 
-    await message.answer_photo(
-        FSInputFile(file),
-        caption=f"<b>{key.upper()}</b>\n\n{link}"
-    )
-    os.remove(file)
+    # Avval yuborilgan rasm qayta yuklanmaydi
+    file_id = place_qr_file_id(key)
+    if file_id:
+        try:
+            return await message.answer_photo(file_id, caption=caption)
+        except TelegramBadRequest:
+            pass
+
+    png = await render_qr(link)
+    sent = await message.answer_photo(BufferedInputFile(png, filename=f"qr_{key}.png"), caption=caption)
+    await set_qr_file_id(key, sent.photo[-1].file_id)
+
+
+@router.message(AdminStates.qr_key)
+async def qr_generate(message: Message, state: FSMContext):
+    key = message.text.strip().lower()
 
     async with async_session() as session:
         log = QRLog(
@@ -353,17 +741,62 @@ async def qr_generate(message: Message, state: FSMContext):
         )
         session.add(log)
         await session.commit()
+    await add_place(key, message.from_user.id)
+
+    await _send_place_qr(message, key)
+    await state.clear()
+
+
+@router.callback_query(F.data.startswith("qr_show:"))
+async def qr_show(call: CallbackQuery, state: FSMContext, role: str):
+    if role != "superadmin":
+        return await call.answer("Faqat SuperAdmin!", show_alert=True)
+
+    key = call.data.split(":", 1)[1]
+    if not place_exists(key):
+        return await call.answer("Bunday joy topilmadi!", show_alert=True)
+
+    await state.clear()
+    await call.answer()
+    await _send_place_qr(call.message, key)
+
+
+@router.callback_query(F.data.startswith("qr_batch:"))
+async def qr_batch(call: CallbackQuery, state: FSMContext, role: str):
+    if role != "superadmin":
+        return await call.answer("Faqat SuperAdmin!", show_alert=True)
+
+    fmt = call.data.split(":", 1)[1]
+    if fmt not in QR_BUNDLES:
+        return await call.answer("Noma'lum format", show_alert=True)
+    keys = place_keys()
+    if not keys:
+        return await call.answer("Hozircha QR kodlar mavjud emas.", show_alert=True)
 
     await state.clear()
+    await call.answer("Tayyorlanmoqda...")
+    started = time.monotonic()
+
+    bot = await call.bot.get_me()
+    links = [f"https://t.me/{bot.username}?start={key}" for key in keys]
+    # Har bir QR process poolda parallel chiziladi
+    images = await asyncio.gather(*[render_qr(link, "print") for link in links])
+    items = [(key, place_name(key), link, png) for key, link, png in zip(keys, links, images)]
+
+    builder, filename = QR_BUNDLES[fmt]
+    data = await run_cpu(builder, items)
+    await call.message.answer_document(
+        BufferedInputFile(data, filename=filename),
+        caption=f"QR kodlar: {len(items)} ta joy\nTayyorlandi: {time.monotonic() - started:.1f} sek"
+    )
 
 
 # ====================== DAVOMAT (Cashier + Admin + SuperAdmin) ======================
 
 # Admin kassir paneli
 @router.callback_query(F.data == "admin_cashier")
-async def cashier_start(call: CallbackQuery, state: FSMContext):
+async def cashier_start(call: CallbackQuery, state: FSMContext, role: str):
     await state.clear()
-    role = await get_role(call.from_user.id)
     if role not in ("cashier", "admin", "superadmin"):
         return await call.answer("Faqat kassirlar ishlatadi!", show_alert=True)
 
@@ -371,6 +804,7 @@ async def cashier_start(call: CallbackQuery, state: FSMContext):
         inline_keyboard=[
             [InlineKeyboardButton(text="Qidirish", switch_inline_query_current_chat="")],
             [InlineKeyboardButton(text="ID orqali belgilash", callback_data="admin_attend_id")],
+            [InlineKeyboardButton(text="Guruhni belgilash", callback_data="admin_attend_bulk")],
             [InlineKeyboardButton(text="Orqaga", callback_data="admin_main")]
         ]
     )
@@ -382,9 +816,35 @@ async def cashier_start(call: CallbackQuery, state: FSMContext):
     await call.answer("Inline qidiruv faollashtirildi!")
 
 
-@router.inline_query(F.query.regexp(r"^\d{3,}|^@|^[a-zA-Z]"))
-async def inline_search_users(inline_query: InlineQuery):
-    if not await is_admin(inline_query.from_user.id):
+# Kassir bo'yicha oxirgi so'rov sahifalari: (kassir, so'rov, offset) -> (natijalar, next_offset)
+search_cache = TTLCache(maxsize=2048, ttl=60)
+SEARCH_CACHE_TIME = 30
+
+
+def _search_result(user: User, place: str) -> InlineQueryResultArticle:
+    return InlineQueryResultArticle(
+        id=str(user.id),
+        title=f"{user.first_name} | {user.phone}",
+        description=f"@{user.username}" if user.username else "",
+        input_message_content=InputTextMessageContent(
+            message_text=f"{user.first_name} | {user.phone}\n@{user.username}" if user.username else f"{user.first_name} | {user.phone}"
+        ),
+        reply_markup=InlineKeyboardMarkup(
+            inline_keyboard=[
+                [
+                    InlineKeyboardButton(text="Ha ✔️",
+                        callback_data=f"confirm_attend:{user.telegram_id}:{place}"),
+                    InlineKeyboardButton(text="Yo‘q ❌",
+                        callback_data="cancel_attend")
+                ]
+            ]
+        )
+    )
+
+
+@router.inline_query(F.query.regexp(r"^\+?\d{3,}|^@|^[^\W\d_]"))
+async def inline_search_users(inline_query: InlineQuery, role: str, admin_place: str | None):
+    if role == "user":
         return await inline_query.answer(
             results=[],
             switch_pm_text="HA ha qiziqishga yozib kurdizmi admin emaskusiz!",
@@ -392,65 +852,34 @@ async def inline_search_users(inline_query: InlineQuery):
             cache_time=1
         )
 
-    query = inline_query.query.strip().lstrip("@")
-    if len(query) < 2:
+    query = inline_query.query.strip()
+    if len(query.lstrip("@")) < 2:
         return
 
-    async with async_session() as session:
-        result = await session.execute(
-            select(User).where(
-                or_(
-                    cast(User.phone, String).ilike(f"%{query}%"),
-                    cast(User.telegram_id, String).ilike(f"%{query}%"),
-                    User.first_name.ilike(f"%{query}%")
-                )
-            ).limit(20)
-        )
-        users = result.scalars().all()
-        admin = await session.scalar(
-            select(Admin).where(Admin.telegram_id == inline_query.from_user.id)
-        )
-        qr_places = await _resolve_accessible_places(session, admin)
-        if not qr_places:
-            qr_places = ["main"]
-
-    results = []
-    for user in users:
-        text = f"<b>{user.first_name}</b>\nTelefon: {user.phone}\n"
-        if user.username:
-            text += f"Username: @{user.username}\n"
-
-        results.append(InlineQueryResultArticle(
-            id=str(user.id),
-            title=f"{user.first_name} | {user.phone}",
-            description=f"@{user.username}" if user.username else "",
-            input_message_content=InputTextMessageContent(
-                message_text=f"{user.first_name} | {user.phone}\n@{user.username}" if user.username else f"{user.first_name} | {user.phone}"
-            ),
-            reply_markup=InlineKeyboardMarkup(
-                inline_keyboard=[
-                    [
-                        InlineKeyboardButton(text="Ha ✔️",
-                            callback_data=f"confirm_attend:{user.telegram_id}:{qr_places[0]}"),
-                        InlineKeyboardButton(text="Yo‘q ❌",
-                            callback_data="cancel_attend")
-                    ]
-                ]
-            )
-        ))
-
-    await inline_query.answer(results, cache_time=1)
+    offset = inline_query.offset or ""
+    key = (inline_query.from_user.id, query.lower(), offset)
+
+    async def load_page():
+        async with async_session() as session:
+            users, next_offset = await search_users(session, query, after=parse_offset(offset))
+        qr_places = _resolve_accessible_places(role, admin_place) or ["main"]
+        return [_search_result(user, qr_places[0]) for user in users], next_offset
+
+    results, next_offset = await search_cache.get_or_load(key, load_page)
+    await inline_query.answer(
+        results,
+        cache_time=SEARCH_CACHE_TIME,
+        is_personal=True,
+        next_offset=next_offset
+    )
 
 
 @router.callback_query(F.data == "admin_attend_id")
-async def attend_by_id_start(call: CallbackQuery, state: FSMContext):
-    if not await is_admin(call.from_user.id):
+async def attend_by_id_start(call: CallbackQuery, state: FSMContext, role: str, admin_place: str | None):
+    if role == "user":
         return await call.answer("Ruxsat yo'q!", show_alert=True)
 
-    async with async_session() as session:
-        admin = await session.scalar(select(Admin).where(Admin.telegram_id == call.from_user.id))
-        places = await _resolve_accessible_places(session, admin)
-
+    places = _resolve_accessible_places(role, admin_place)
     if not places:
         return await call.answer("Avval QR joylarini yarating!", show_alert=True)
 
@@ -463,10 +892,8 @@ async def attend_by_id_start(call: CallbackQuery, state: FSMContext):
 
 
 @router.message(AdminStates.cashier_search)
-async def attend_by_id_lookup(message: Message, state: FSMContext):
+async def attend_by_id_lookup(message: Message, state: FSMContext, role: str, admin_place: str | None):
     identifier = message.text.strip()
-    marked_at = None
-    place_used = None
 
     async with async_session() as session:
         user = await _find_user_by_identifier(session, identifier)
@@ -477,8 +904,7 @@ async def attend_by_id_lookup(message: Message, state: FSMContext):
         data = await state.get_data()
         places = data.get("attend_places") or []
         if not places:
-            admin = await session.scalar(select(Admin).where(Admin.telegram_id == message.from_user.id))
-            places = await _resolve_accessible_places(session, admin)
+            places = _resolve_accessible_places(role, admin_place)
             await state.update_data(attend_places=places)
 
         if not places:
@@ -487,8 +913,12 @@ async def attend_by_id_lookup(message: Message, state: FSMContext):
 
         if len(places) == 1:
             place_used = places[0]
-            marked_at = await _mark_attendance(session, user, place_used, message.from_user.id)
-            await message.answer(f"{user.first_name} uchun {place_used} joyi belgilandi.")
+            marks = await _mark_attendance(session, User.id == user.id, place_used, message.from_user.id)
+            if marks and marks[0].created:
+                await message.answer(f"{user.first_name} uchun {place_used} joyi belgilandi.")
+            else:
+                await message.answer(f"{user.first_name} bugun {place_used} joyida allaqachon belgilangan.")
+            await state.clear()
         else:
             buttons = [
                 [InlineKeyboardButton(text=place, callback_data=f"attend_place:{user.telegram_id}:{place}")]
@@ -500,30 +930,29 @@ async def attend_by_id_lookup(message: Message, state: FSMContext):
             )
             return
 
-    if marked_at and place_used:
-        await _notify_attendance(message.bot, user, place_used, marked_at)
+
+async def _confirm_mark(call: CallbackQuery, user_tg_id: int, place: str):
+    # Oldindan SELECT yo'q: takroriy bosish bitta arzon so'rov bilan tugaydi
+    async with async_session() as session:
+        marks = await _mark_attendance(session, User.telegram_id == user_tg_id, place, call.from_user.id)
+
+    if not marks:
+        return await call.answer("Foydalanuvchi topilmadi", show_alert=True)
+    if not marks[0].created:
+        return await call.answer("Bugun bu joyda allaqachon belgilangan ✔️", show_alert=True)
+
+    await call.answer("Belgilandi ✔️", show_alert=True)
 
 
 @router.callback_query(F.data.startswith("attend_place:"))
-async def attend_place_callback(call: CallbackQuery):
+async def attend_place_callback(call: CallbackQuery, role: str, admin_place: str | None):
     _, user_tg_id, place = call.data.split(":", 2)
     user_tg_id = int(user_tg_id)
 
-    async with async_session() as session:
-        admin = await session.scalar(select(Admin).where(Admin.telegram_id == call.from_user.id))
-        places = await _resolve_accessible_places(session, admin)
-        if place not in places:
-            return await call.answer("Bu joy sizga biriktirilmagan!", show_alert=True)
-
-        result = await session.execute(select(User).where(User.telegram_id == user_tg_id))
-        user = result.scalar_one_or_none()
-        if not user:
-            return await call.answer("Foydalanuvchi topilmadi", show_alert=True)
+    if not _place_allowed(role, admin_place, place):
+        return await call.answer("Bu joy sizga biriktirilmagan!", show_alert=True)
 
-        marked_at = await _mark_attendance(session, user, place, call.from_user.id)
-
-    await call.answer("Belgilandi ✔️", show_alert=True)
-    await _notify_attendance(call.bot, user, place, marked_at)
+    await _confirm_mark(call, user_tg_id, place)
 
 
 @router.callback_query(F.data.startswith("confirm_attend:"))
@@ -531,16 +960,7 @@ async def confirm_attend(call: CallbackQuery):
     _, user_tg_id, place = call.data.split(":")
     user_tg_id = int(user_tg_id)
 
-    async with async_session() as session:
-        result = await session.execute(select(User).where(User.telegram_id == user_tg_id))
-        user = result.scalar_one_or_none()
-
-        if not user:
-            return await call.answer("Foydalanuvchi topilmadi", show_alert=True)
-        marked_at = await _mark_attendance(session, user, place, call.from_user.id)
-    
-    await call.answer("Belgilandi ✔️", show_alert=True)
-    await _notify_attendance(call.bot, user, place, marked_at)
+    await _confirm_mark(call, user_tg_id, place)
 
 
 @router.callback_query(F.data == "cancel_attend")
@@ -548,10 +968,202 @@ async def cancel_attend(call: CallbackQuery):
     await call.answer("Bekor qilindi ❌", show_alert=True)
 
 
+# ---------- Guruhni belgilash: ro'yxat yig'iladi, bitta so'rov bilan belgilanadi ----------
+BULK_LIMIT = 200
+PHONE_LINE_RE = re.compile(r"^\+?[\d\s()-]{7,}$")
+# Belgilarsiz telefon faqat odatiy ko'rinishda: "998 90 123 45 67" yoki "90 123 45 67"
+PHONE_GROUPED_RE = re.compile(r"^(?:998\s+)?\d{2}\s+\d{3}\s+\d{2}\s+\d{2}$")
+
+
+def _is_phone_line(line: str) -> bool:
+    if not PHONE_LINE_RE.match(line):
+        return False
+    return any(ch in "+()-" for ch in line) or bool(PHONE_GROUPED_RE.match(line))
+
+
+def _parse_bulk_tokens(text: str) -> list[str]:
+    tokens = []
+    for line in re.split(r"[\n,;]+", text):
+        line = line.strip()
+        if not line:
+            continue
+        # "+998 90 123 45 67" — bitta telefon; "1001 1002" esa ikkita ID
+        if _is_phone_line(line):
+            tokens.append("".join(ch for ch in line if ch.isdigit()))
+        else:
+            # Skanerdan kelgan havola yoki "/start ci_..." dan faqat token olinadi
+            tokens.extend(
+                word.rsplit("start=", 1)[-1] if "start=" in word else word
+                for word in line.split() if word != "/start"
+            )
+    return tokens
+
+
+BULK_COLUMNS = {
+    "username": func.lower(User.username),
+    "telegram_id": User.telegram_id,
+    "id": User.id,
+    "phone": User.phone,
+}
+
+
+def _classify_bulk_token(token: str) -> list[tuple[str, object]]:
+    # (ustun, qiymat) — _identifier_conditions dagi ustuvorlik tartibida
+    if token.startswith(CHECKIN_PREFIX):
+        user_id = verify_token(token)
+        return [("id", user_id)] if user_id is not None else []
+    # Ro'yxatda username faqat "@" bilan — oddiy so'zlar (ismlar) username deb olinmaydi
+    if token.startswith("@"):
+        username = token[1:].lower()
+        return [("username", username)] if USERNAME_RE.match(username) else []
+    if token.isdigit():
+        lookups = [("telegram_id", int(token)), ("id", int(token))] if len(token) <= 18 else []
+        return [*lookups, ("phone", token)]
+    return []
+
+
+async def _resolve_bulk_tokens(session, tokens: list[str]) -> tuple[set[int], int]:
+    # Bitta IN so'rov; har bir token o'zining eng ustuvor mosligiga bog'lanadi.
+    # Qaytadi: (users.id lar, topilmagan tokenlar soni)
+    lookups = {token: _classify_bulk_token(token) for token in tokens}
+    values: dict[str, set] = {kind: set() for kind in BULK_COLUMNS}
+    for items in lookups.values():
+        for kind, value in items:
+            values[kind].add(value)
+
+    conditions = [BULK_COLUMNS[kind].in_(vals) for kind, vals in values.items() if vals]
+    if not conditions:
+        return set(), len(tokens)
+
+    result = await session.execute(
+        select(User.id, *BULK_COLUMNS.values()).where(or_(*conditions)).order_by(User.id)
+    )
+    # Bir nechta foydalanuvchiga mos keladigan qiymat (masalan umumiy telefon) — eng kichik id
+    index: dict[str, dict] = {kind: {} for kind in BULK_COLUMNS}
+    for user_id, *row in result.all():
+        for kind, value in zip(BULK_COLUMNS, row):
+            index[kind].setdefault(value, user_id)
+
+    resolved, missing = set(), 0
+    for items in lookups.values():
+        user_id = next((index[kind][value] for kind, value in items if value in index[kind]), None)
+        if user_id is None:
+            missing += 1
+        else:
+            resolved.add(user_id)
+    return resolved, missing
+
+
+def _bulk_keyboard(count: int) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text=f"✅ Belgilash ({count} ta)", callback_data="bulk_commit")],
+        [InlineKeyboardButton(text="🔄 Tozalash", callback_data="bulk_reset")],
+        [InlineKeyboardButton(text="Orqaga", callback_data="admin_cashier")]
+    ])
+
+
+async def _bulk_prompt(call: CallbackQuery, state: FSMContext, place: str):
+    await state.set_state(AdminStates.bulk_checkin)
+    await state.update_data(bulk_place=place, bulk_tokens=[])
+    await call.message.edit_text(
+        f"<b>Guruhni belgilash</b> — joy: <b>{place}</b>\n\n"
+        "Telegram ID, telefon yoki @username larni yuboring (har qatorda yoki vergul bilan). "
+        "Bir nechta xabar yoki QR skanlarni ketma-ket yuborish mumkin.\n"
+        f"Bir martada {BULK_LIMIT} tagacha.",
+        reply_markup=_bulk_keyboard(0)
+    )
+
+
+@router.callback_query(F.data == "admin_attend_bulk")
+async def bulk_start(call: CallbackQuery, state: FSMContext, role: str, admin_place: str | None):
+    if role == "user":
+        return await call.answer("Ruxsat yo'q!", show_alert=True)
+
+    places = _resolve_accessible_places(role, admin_place)
+    if not places:
+        return await call.answer("Avval QR joylarini yarating!", show_alert=True)
+    if len(places) == 1:
+        return await _bulk_prompt(call, state, places[0])
+
+    await call.message.edit_text(
+        "Guruh qaysi joyda belgilanadi?",
+        reply_markup=InlineKeyboardMarkup(inline_keyboard=[
+            *[[InlineKeyboardButton(text=place_name(place), callback_data=f"bulk_place:{place}")] for place in places],
+            [InlineKeyboardButton(text="Orqaga", callback_data="admin_cashier")]
+        ])
+    )
+
+
+@router.callback_query(F.data.startswith("bulk_place:"))
+async def bulk_place(call: CallbackQuery, state: FSMContext, role: str, admin_place: str | None):
+    place = call.data.split(":", 1)[1]
+    if not _place_allowed(role, admin_place, place):
+        return await call.answer("Bu joy sizga biriktirilmagan!", show_alert=True)
+    await _bulk_prompt(call, state, place)
+
+
+@router.message(AdminStates.bulk_checkin)
+async def bulk_collect(message: Message, state: FSMContext):
+    text = message.text or message.caption or ""
+    parsed = _parse_bulk_tokens(text)
+    # ID/telefon/username bo'lmagan so'zlar ("ID:", ismlar) ro'yxatga kirmaydi
+    new_tokens = [token for token in parsed if _classify_bulk_token(token)]
+    unknown = len(parsed) - len(new_tokens)
+    if not new_tokens:
+        return await message.answer("Ro'yxatdan ID, telefon yoki username topilmadi.")
+
+    data = await state.get_data()
+    tokens = list(dict.fromkeys([*data.get("bulk_tokens", []), *new_tokens]))
+    if len(tokens) > BULK_LIMIT:
+        tokens = tokens[:BULK_LIMIT]
+        await message.answer(f"Bir martada {BULK_LIMIT} tadan ortiq belgilab bo'lmaydi, ortiqchasi olinmadi.")
+    await state.update_data(bulk_tokens=tokens)
+
+    skipped = f"\nTanilmadi: {unknown} ta" if unknown else ""
+    await message.answer(
+        f"Ro'yxatda: <b>{len(tokens)}</b> ta.{skipped} Davom eting yoki belgilang.",
+        reply_markup=_bulk_keyboard(len(tokens))
+    )
+
+
+@router.callback_query(F.data == "bulk_reset", AdminStates.bulk_checkin)
+async def bulk_reset(call: CallbackQuery, state: FSMContext):
+    await state.update_data(bulk_tokens=[])
+    await call.message.edit_text("Ro'yxat tozalandi. Qaytadan yuboring.", reply_markup=_bulk_keyboard(0))
+
+
+@router.callback_query(F.data == "bulk_commit", AdminStates.bulk_checkin)
+async def bulk_commit(call: CallbackQuery, state: FSMContext, role: str, admin_place: str | None):
+    data = await state.get_data()
+    place = data.get("bulk_place")
+    tokens = data.get("bulk_tokens", [])
+    if not place or not _place_allowed(role, admin_place, place):
+        return await call.answer("Bu joy sizga biriktirilmagan!", show_alert=True)
+
+    if not tokens:
+        return await call.answer("Ro'yxat bo'sh!", show_alert=True)
+
+    # Tokenlar bitta IN so'rov bilan aniqlanadi, keyin multi-row insert, rollup va outbox — bitta so'rov
+    async with async_session() as session:
+        user_ids, missing = await _resolve_bulk_tokens(session, tokens)
+        marks = await _mark_attendance(session, User.id.in_(user_ids), place, call.from_user.id) if user_ids else []
+    await state.clear()
+
+    created = sum(1 for mark in marks if mark.created)
+    await call.message.edit_text(
+        f"<b>Guruh belgilandi</b> — joy: <b>{place}</b>\n\n"
+        f"Yuborildi: {len(tokens)} ta\n"
+        f"Belgilandi: {created} ta\n"
+        f"Bugun allaqachon belgilangan: {len(marks) - created} ta\n"
+        f"Topilmadi: {missing} ta",
+        reply_markup=back_button("admin_cashier")
+    )
+
+
 # ====================== SUPERADMIN: ADMINLAR BOSHQARUVI ======================
 @router.callback_query(F.data == "manage_admins")
-async def manage_admins(call: CallbackQuery):
-    if await get_role(call.from_user.id) != "superadmin":
+async def manage_admins(call: CallbackQuery, role: str):
+    if role != "superadmin":
         return await call.answer("Faqat SuperAdmin!", show_alert=True)
 
     async with async_session() as session:
@@ -575,8 +1187,8 @@ async def manage_admins(call: CallbackQuery):
 
 
 @router.callback_query(F.data == "add_admin")
-async def add_admin_start(call: CallbackQuery, state: FSMContext):
-    if await get_role(call.from_user.id) != "superadmin":
+async def add_admin_start(call: CallbackQuery, state: FSMContext, role: str):
+    if role != "superadmin":
         return
     await call.message.edit_text(
         "Yangi adminning <b>Telegram ID</b> raqamini yuboring:",
@@ -632,8 +1244,8 @@ async def add_admin_confirm(call: CallbackQuery, state: FSMContext):
                 "Kassir qaysi joyda ishlaydi?\nQR kodlar asosida joyni tanlang:",
                 reply_markup=InlineKeyboardMarkup(inline_keyboard=[
                     *[
-                        [InlineKeyboardButton(text=qr.source_key, callback_data=f"cashier_place:{qr.source_key}")]
-                        for qr in (await session.execute(select(QRLog))).scalars().all()
+                        [InlineKeyboardButton(text=place_name(key), callback_data=f"cashier_place:{key}")]
+                        for key in place_keys()
                     ],
                     [InlineKeyboardButton(text="🔙 Orqaga", callback_data="admin_main")]
                 ])
@@ -642,7 +1254,7 @@ async def add_admin_confirm(call: CallbackQuery, state: FSMContext):
         new_admin = Admin(telegram_id=tg_id, role=role, added_by=call.from_user.id)
         session.add(new_admin)
         await session.commit()
-
+    invalidate_roles()
 
     await call.message.edit_text(
         f"Yangi admin qo'shildi!\n\nID: <code>{tg_id}</code>\nRol: <b>{role.upper()}</b>",
@@ -666,6 +1278,7 @@ async def set_cashier_place(call: CallbackQuery, state: FSMContext):
         )
         session.add(new_admin)
         await session.commit()
+    invalidate_roles()
 
     await call.message.edit_text(
         f"Kassir qo'shildi!\nID: {tg_id}\nJoy: <b>{place}</b>",
@@ -675,8 +1288,8 @@ async def set_cashier_place(call: CallbackQuery, state: FSMContext):
 
 # ====================== ADMIN O'CHIRISH ======================
 @router.callback_query(F.data == "remove_admin")
-async def remove_admin_start(call: CallbackQuery):
-    if await get_role(call.from_user.id) != "superadmin":
+async def remove_admin_start(call: CallbackQuery, role: str):
+    if role != "superadmin":
         return
 
     async with async_session() as session:
@@ -718,14 +1331,15 @@ async def remove_admin_confirm(call: CallbackQuery):
 
         await session.delete(admin)
         await session.commit()
+    invalidate_roles()
 
     await call.message.edit_text(f"{tg_id} adminlikdan olindi!", reply_markup=back_button())
 
 
 # ====================== ORQAGA QAYTISH ======================
 @router.callback_query(F.data == "admin_main")
-async def back_to_main(call: CallbackQuery):
-    role = await get_role(call.from_user.id)
+async def back_to_main(call: CallbackQuery, state: FSMContext, role: str):
+    await state.clear()
     await call.message.edit_text(
         "Admin panel",
         reply_markup=admin_main_keyboard(role)
@@ -8,6 +8,7 @@ def admin_main_keyboard(role: str) -> InlineKeyboardMarkup:
     # Har bir rol uchun ko'rinadigan tugmalar
     if role in ("analyst", "admin", "superadmin"):
         kb.append([InlineKeyboardButton(text="Statistika", callback_data="admin_stats")])
+        kb.append([InlineKeyboardButton(text="Grafiklar", callback_data="admin_charts")])
 
     if role in ("admin", "superadmin","analyst"):
         kb.append([InlineKeyboardButton(text="Foydalanuvchilar", callback_data="admin_export")])
@@ -1,6 +1,25 @@
 from dotenv import load_dotenv
+from zoneinfo import ZoneInfo
 import os
 
 load_dotenv()
 
-ADMIN_IDS=list(map(int, os.getenv("ADMIN_IDS", "").split(",")))
\ No newline at end of file
+ADMIN_IDS=list(map(int, os.getenv("ADMIN_IDS", "").split(",")))
+
+# Broadcast: umumiy tezlik (xabar/sek) va parallel yuboruvchilar soni
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "30"))
+BROADCAST_WORKERS = int(os.getenv("BROADCAST_WORKERS", "20"))
+
+# Export va QR generatsiya uchun worker pool hajmi
+POOL_WORKERS = int(os.getenv("POOL_WORKERS", "2"))
+
+# Park joylashgan vaqt zonasi — kunlik statistika shu bo'yicha hisoblanadi
+TIMEZONE_NAME = os.getenv("TIMEZONE", "Asia/Tashkent")
+TIMEZONE = ZoneInfo(TIMEZONE_NAME)
+
+# Ro'yxatdan o'tganlar keshi: "set" (aniq) yoki "bloom" (ixcham, musbat javob DB da tekshiriladi)
+MEMBERSHIP_MODE = os.getenv("MEMBERSHIP_MODE", "set")
+MEMBERSHIP_CAPACITY = int(os.getenv("MEMBERSHIP_CAPACITY", "1000000"))
+
+# Check-in QR tokenlari imzosi uchun kalit (berilmasa bot tokeni ishlatiladi)
+CHECKIN_SECRET = os.getenv("CHECKIN_SECRET") or os.getenv("BOT_TOKEN", "")
@@ -5,9 +5,21 @@ from aiogram import Bot, Dispatcher
 from dotenv import load_dotenv
 import os
 
+from sqlalchemy import text
+
 from database import engine, Base
 from user.handlers import router as user_router
 from admin.handlers import router as admin_router  # agar admin tayyor bo‘lsa
+from utils.broadcast import broadcast_worker
+from utils.outbox import outbox_dispatcher
+from utils.reachability import load_unreachable
+from utils.middlewares import ReachabilityMiddleware, RoleMiddleware
+from utils.admin_check import load_roles
+from utils.membership import members
+from utils.places import load_places
+from utils.executors import shutdown_executors
+from utils.stats import backfill_daily_stats, backfill_cashier_stats
+from config import TIMEZONE_NAME
 from aiogram.client.default import DefaultBotProperties
 
 
@@ -20,16 +32,111 @@ bot = Bot(
 )
 dp = Dispatcher()
 
+# create_all mavjud jadvallarga yangi ustun va indekslarni qo'shmaydi
+SCHEMA_UPGRADES = [
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS reachable BOOLEAN NOT NULL DEFAULT TRUE",
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS unreachable_at TIMESTAMPTZ",
+    "CREATE INDEX IF NOT EXISTS ix_users_reachable_id ON users (id) WHERE reachable",
+    "CREATE INDEX IF NOT EXISTS ix_users_unreachable_tg ON users (telegram_id) WHERE NOT reachable",
+    # last_place bir marta attendance_logs dan to'ldiriladi
+    """
+    DO $$ BEGIN
+        IF NOT EXISTS (
+            SELECT 1 FROM information_schema.columns
+            WHERE table_name = 'users' AND column_name = 'last_place'
+        ) THEN
+            ALTER TABLE users ADD COLUMN last_place VARCHAR(50);
+            UPDATE users u SET last_place = a.place
+            FROM (
+                SELECT DISTINCT ON (user_id) user_id, place
+                FROM attendance_logs ORDER BY user_id, marked_at DESC
+            ) a
+            WHERE a.user_id = u.telegram_id;
+        END IF;
+    END $$
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_users_gender ON users (gender)",
+    "CREATE INDEX IF NOT EXISTS ix_users_source ON users (source)",
+    "CREATE INDEX IF NOT EXISTS ix_users_attended ON users (attended)",
+    "CREATE INDEX IF NOT EXISTS ix_users_registered_at ON users (registered_at)",
+    "CREATE INDEX IF NOT EXISTS ix_users_last_place ON users (last_place)",
+    "CREATE INDEX IF NOT EXISTS ix_attendance_marked_at_by ON attendance_logs (marked_at, marked_by)",
+    # Inline qidiruv: normallashtirilgan ustunlar + trigram indekslar
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS phone_digits VARCHAR(20) "
+    "GENERATED ALWAYS AS (regexp_replace(phone, '[^0-9]', '', 'g')) STORED",
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS name_lower VARCHAR(100) "
+    "GENERATED ALWAYS AS (lower(coalesce(first_name, ''))) STORED",
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS username_lower VARCHAR(100) "
+    "GENERATED ALWAYS AS (lower(coalesce(username, ''))) STORED",
+    "CREATE INDEX IF NOT EXISTS ix_users_phone_digits_trgm ON users USING gin (phone_digits gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_users_name_lower_trgm ON users USING gin (name_lower gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_users_username_lower_trgm ON users USING gin (username_lower gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_users_name_lower_prefix ON users (name_lower varchar_pattern_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_users_username_lower_prefix ON users (username_lower varchar_pattern_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_users_phone ON users (phone)",
+    "CREATE INDEX IF NOT EXISTS ix_users_lower_username ON users (lower(username))",
+    # visit_day faqat har (user, joy, kun) ning birinchi yozuviga qo'yiladi — eski takrorlar NULL qoladi
+    f"""
+    DO $$ BEGIN
+        IF NOT EXISTS (
+            SELECT 1 FROM information_schema.columns
+            WHERE table_name = 'attendance_logs' AND column_name = 'visit_day'
+        ) THEN
+            ALTER TABLE attendance_logs ADD COLUMN visit_day DATE;
+            UPDATE attendance_logs a SET visit_day = f.day
+            FROM (
+                SELECT min(id) AS id, (marked_at AT TIME ZONE '{TIMEZONE_NAME}')::date AS day
+                FROM attendance_logs
+                GROUP BY user_id, place, (marked_at AT TIME ZONE '{TIMEZONE_NAME}')::date
+            ) f
+            WHERE a.id = f.id;
+            ALTER TABLE attendance_logs
+                ADD CONSTRAINT uq_attendance_user_place_day UNIQUE (user_id, place, visit_day);
+        END IF;
+    END $$
+    """,
+    "ALTER TABLE places ADD COLUMN IF NOT EXISTS qr_file_id VARCHAR(200)",
+    # Joylar reyestri qr_logs dagi kalitlardan to'ldiriladi
+    """
+    INSERT INTO places (key, name, created_by, created_at)
+    SELECT DISTINCT ON (source_key) source_key, initcap(replace(source_key, '_', ' ')), admin_id, created_at
+    FROM qr_logs WHERE source_key IS NOT NULL
+    ORDER BY source_key, created_at
+    ON CONFLICT (key) DO NOTHING
+    """,
+]
+
 async def create_tables():
     async with engine.begin() as conn:
+        # trigram indekslar uchun kerak (create_all dan oldin)
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
         await conn.run_sync(Base.metadata.create_all)
+        for statement in SCHEMA_UPGRADES:
+            await conn.execute(text(statement))
 
 async def main():
     await create_tables()
+    await load_unreachable()
+    await load_roles()
+    await load_places()
+    await members.load()
+    await backfill_daily_stats()
+    await backfill_cashier_stats()
 
+    dp.update.outer_middleware(ReachabilityMiddleware())
+    dp.update.outer_middleware(RoleMiddleware())
     dp.include_router(admin_router)
     dp.include_router(user_router)  # keyinroq qo‘shasiz
-    await dp.start_polling(bot)
+
+    # Broadcastlar update handlerdan tashqarida, fonda yuboriladi
+    broadcast_task = asyncio.create_task(broadcast_worker(bot))
+    outbox_task = asyncio.create_task(outbox_dispatcher(bot))
+    try:
+        await dp.start_polling(bot)
+    finally:
+        broadcast_task.cancel()
+        outbox_task.cancel()
+        shutdown_executors()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -1,5 +1,5 @@
 # models.py
-from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Boolean, Text, Date
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Boolean, Text, Date, Index, UniqueConstraint, JSON, Computed, true
 from sqlalchemy.sql import func
 from database import Base
 from datetime import datetime
@@ -11,14 +11,38 @@ class User(Base):
     telegram_id = Column(BigInteger, unique=True, index=True, nullable=False)
     first_name = Column(String(100))
     username = Column(String(100))
-    phone = Column(String(20), nullable=False)
-    source = Column(String(100), nullable=False)
+    phone = Column(String(20), nullable=False, index=True)
+    source = Column(String(100), nullable=False, index=True)
     birth_date = Column(Date, nullable=True)
-    gender = Column(String(10), nullable=True)
+    gender = Column(String(10), nullable=True, index=True)
     profile_photo = Column(Text)
-    registered_at = Column(DateTime(timezone=True), server_default=func.now())
-    attended = Column(Boolean, default=False)
+    registered_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+    attended = Column(Boolean, default=False, index=True)
     attended_date = Column(DateTime(timezone=True), nullable=True)
+    last_place = Column(String(50), nullable=True, index=True)
+    # Botni bloklagan / chat topilmagan foydalanuvchilar broadcastlardan chiqariladi
+    reachable = Column(Boolean, nullable=False, default=True, server_default=true())
+    unreachable_at = Column(DateTime(timezone=True), nullable=True)
+    # Kassir qidiruvi uchun normallashtirilgan ustunlar (pg_trgm indekslari bilan)
+    phone_digits = Column(String(20), Computed("regexp_replace(phone, '[^0-9]', '', 'g')", persisted=True))
+    name_lower = Column(String(100), Computed("lower(coalesce(first_name, ''))", persisted=True))
+    username_lower = Column(String(100), Computed("lower(coalesce(username, ''))", persisted=True))
+
+    __table_args__ = (
+        Index("ix_users_reachable_id", "id", postgresql_where=reachable),
+        Index("ix_users_unreachable_tg", "telegram_id", postgresql_where=~reachable),
+        Index("ix_users_lower_username", func.lower(username)),
+        Index("ix_users_phone_digits_trgm", "phone_digits",
+              postgresql_using="gin", postgresql_ops={"phone_digits": "gin_trgm_ops"}),
+        Index("ix_users_name_lower_trgm", "name_lower",
+              postgresql_using="gin", postgresql_ops={"name_lower": "gin_trgm_ops"}),
+        Index("ix_users_username_lower_trgm", "username_lower",
+              postgresql_using="gin", postgresql_ops={"username_lower": "gin_trgm_ops"}),
+        # 2 harfli so'rovlarda trigram yo'q — prefiks LIKE btree indeksdan foydalanadi
+        Index("ix_users_name_lower_prefix", "name_lower", postgresql_ops={"name_lower": "varchar_pattern_ops"}),
+        Index("ix_users_username_lower_prefix", "username_lower",
+              postgresql_ops={"username_lower": "varchar_pattern_ops"}),
+    )
 
 
 class Admin(Base):
@@ -47,4 +71,104 @@ class AttendanceLog(Base):
     user_id = Column(BigInteger, nullable=False)  
     place = Column(String(50), nullable=False)    
     marked_by = Column(BigInteger, nullable=False) 
-    marked_at = Column(DateTime(timezone=True), server_default=func.now())
\ No newline at end of file
+    marked_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Park vaqti bo'yicha kun: bitta joyda kuniga bitta tashrif
+    visit_day = Column(Date, nullable=True)
+
+    __table_args__ = (
+        Index("ix_attendance_marked_at_by", "marked_at", "marked_by"),
+        UniqueConstraint("user_id", "place", "visit_day", name="uq_attendance_user_place_day"),
+    )
+
+
+class BroadcastJob(Base):
+    __tablename__ = "broadcast_jobs"
+
+    id = Column(BigInteger, primary_key=True)
+    created_by = Column(BigInteger, nullable=False)
+    segment = Column(JSON, nullable=False, default=dict)
+    content_type = Column(String(20), nullable=False)
+    text = Column(Text, nullable=True)
+    source_chat_id = Column(BigInteger, nullable=False)
+    source_message_id = Column(BigInteger, nullable=False)
+    progress_chat_id = Column(BigInteger, nullable=True)
+    progress_message_id = Column(BigInteger, nullable=True)
+    status = Column(String(20), nullable=False, default="pending", index=True)
+    total = Column(Integer, nullable=False, default=0)
+    sent = Column(Integer, nullable=False, default=0)
+    blocked = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class BroadcastDelivery(Base):
+    __tablename__ = "broadcast_deliveries"
+
+    job_id = Column(BigInteger, primary_key=True)
+    user_id = Column(BigInteger, primary_key=True)
+    status = Column(String(10), nullable=False)
+    delivered_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class ExportWatermark(Base):
+    __tablename__ = "export_watermarks"
+
+    admin_id = Column(BigInteger, primary_key=True)
+    export_type = Column(String(20), primary_key=True)
+    last_id = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class DailyStat(Base):
+    __tablename__ = "daily_stats"
+
+    # Bo'sh satr — "barcha joylar"/"manbasiz" (PK ustunlari NULL bo'la olmaydi)
+    day = Column(Date, primary_key=True)
+    place = Column(String(50), primary_key=True, default="")
+    source = Column(String(100), primary_key=True, default="")
+    registrations = Column(Integer, nullable=False, default=0)
+    visits = Column(Integer, nullable=False, default=0)
+
+
+class CashierStat(Base):
+    __tablename__ = "cashier_stats"
+
+    # Kunlik yig'indi: istalgan kun/hafta/oy/yil oralig'i bir necha qatorni qo'shish bilan olinadi
+    day = Column(Date, primary_key=True)
+    marked_by = Column(BigInteger, primary_key=True)
+    place = Column(String(50), primary_key=True)
+    visits = Column(Integer, nullable=False, default=0)
+
+
+class Place(Base):
+    __tablename__ = "places"
+
+    id = Column(BigInteger, primary_key=True)
+    key = Column(String(50), unique=True, nullable=False)
+    name = Column(String(100), nullable=False)
+    # Yuborilgan QR rasmining Telegram file_id si — qayta ko'rsatishda yuklanmaydi
+    qr_file_id = Column(String(200), nullable=True)
+    created_by = Column(BigInteger, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class Outbox(Base):
+    __tablename__ = "outbox"
+
+    id = Column(BigInteger, primary_key=True)
+    kind = Column(String(30), nullable=False)
+    chat_id = Column(BigInteger, nullable=False)
+    payload = Column(JSON, nullable=False)
+    # pending / sent / blocked / failed
+    status = Column(String(10), nullable=False, default="pending", server_default="pending")
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    next_attempt_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    last_error = Column(String(200), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    sent_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index("ix_outbox_pending", "next_attempt_at", postgresql_where=(status == "pending")),
+    )
@@ -1,11 +1,15 @@
 # user/handlers.py
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery
+from aiogram.types import Message, CallbackQuery, BufferedInputFile, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.filters import CommandStart
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from database import async_session
 from models import User
+from utils.stats import record_registration, invalidate_dashboard
+from utils.membership import members, is_registered
+from utils.checkin import checkin_link
+from utils.misc import render_qr
 from user.keyboards import subscription_keyboard, phone_keyboard
 from sqlalchemy import select
 import os
@@ -40,16 +44,12 @@ async def cmd_start(message: Message, state: FSMContext, command=None):
 
     await state.update_data(source=source)
 
-    # Bazada bor-yo‘qligini tekshirish
-    async with async_session() as session:
-        result = await session.execute(
-            select(User.telegram_id).where(User.telegram_id == user.id)
+    # Bazada bor-yo‘qligini tekshirish (avval xotiradagi keshdan)
+    if await is_registered(user.id):
+        await message.answer(
+            "Siz allaqachon ro‘yxatdan o‘tgansiz!\nFamilyParkda sizni kutamiz!"
         )
-        if result.scalar_one_or_none():
-            await message.answer(
-                "Siz allaqachon ro‘yxatdan o‘tgansiz!\nFamilyParkda sizni kutamiz!"
-            )
-            return
+        return
 
     # Obuna so‘rash
     await message.answer(
@@ -101,7 +101,10 @@ async def save_contact(message: Message, state: FSMContext):
             profile_photo=photo_id
         )
         session.add(new_user)
+        await record_registration(session, source)
         await session.commit()
+    members.add(user.id)
+    invalidate_dashboard()
 
     await message.answer(
         "Rahmat! Siz muvaffaqiyatli ro‘yxatdan o‘tdingiz.\n\n"
@@ -123,6 +126,9 @@ async def any_message(message: Message):
 
 @router.callback_query(F.data == "profile")
 async def check_subscription(call: CallbackQuery, state: FSMContext):
+    if members.check(call.from_user.id) is False:
+        await call.message.answer("Siz ro‘yxatdan o‘tmagansiz!\n\n Faqat Family Park orqali ro'yxatdan o'ting")
+        return
     async with async_session() as session:
         result = await session.execute(
             select(User).where(User.telegram_id == call.from_user.id)
@@ -132,5 +138,22 @@ async def check_subscription(call: CallbackQuery, state: FSMContext):
             await call.message.answer("Siz ro‘yxatdan o‘tmagansiz!\n\n Faqat Family Park orqali ro'yxatdan o'ting", show_alert=True)
             return
     print(user.telegram_id,user.first_name)
-    await call.message.answer(f"Sizning profilingiz:\n\nTelegram ID: {user.telegram_id}\nIsmingiz: {user.first_name}\nUsername: @{user.username}\nTelefon raqamingiz: {user.phone}")
+    kb = InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="📲 Kirish QR kodi", callback_data="checkin_qr")]])
+    await call.message.answer(f"Sizning profilingiz:\n\nTelegram ID: {user.telegram_id}\nIsmingiz: {user.first_name}\nUsername: @{user.username}\nTelefon raqamingiz: {user.phone}", reply_markup=kb)
+
+
+@router.callback_query(F.data == "checkin_qr")
+async def checkin_qr(call: CallbackQuery):
+    async with async_session() as session:
+        user_id = await session.scalar(select(User.id).where(User.telegram_id == call.from_user.id))
+    if user_id is None:
+        return await call.answer("Siz ro‘yxatdan o‘tmagansiz!", show_alert=True)
+
+    bot = await call.bot.get_me()
+    png = await render_qr(checkin_link(bot.username, user_id))
+    await call.message.answer_photo(
+        BufferedInputFile(png, filename="checkin.png"),
+        caption="Kassada shu QR kodni ko‘rsating — tashrifingiz bir zumda belgilanadi."
+    )
+    await call.answer()
     
\ No newline at end of file
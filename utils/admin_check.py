@@ -1,25 +1,53 @@
 # utils/admin_check.py
+import asyncio
+
 from database import async_session
 from models import Admin
 from sqlalchemy import select
 from config import ADMIN_IDS
 
+# telegram_id -> (role, place); admins jadvali kichik, butunlay xotirada saqlanadi
+_admins: dict[int, tuple[str, str | None]] = {}
+_loaded = False
+_lock = asyncio.Lock()
+
+
+async def load_roles():
+    global _loaded
+    async with _lock:
+        async with async_session() as session:
+            result = await session.execute(select(Admin.telegram_id, Admin.role, Admin.place))
+            rows = result.all()
+        _admins.clear()
+        _admins.update({tg_id: (role, place) for tg_id, role, place in rows})
+        _loaded = True
+
+
+# admins jadvali o'zgarganda chaqiriladi — keyingi so'rovda qayta yuklanadi
+def invalidate_roles():
+    global _loaded
+    _loaded = False
+
+
+async def _lookup(user_id: int) -> tuple[str, str | None] | None:
+    if not _loaded:
+        await load_roles()
+    return _admins.get(user_id)
+
 
 async def is_admin(user_id: int) -> bool:
     if user_id in ADMIN_IDS:
         return True
-    async with async_session() as session:
-        result = await session.execute(
-            select(Admin.telegram_id).where(Admin.telegram_id == user_id)
-        )
-        return result.scalar_one_or_none() is not None
+    return await _lookup(user_id) is not None
+
 
 async def get_role(user_id: int) -> str:
     if user_id in ADMIN_IDS:
         return "superadmin"
-    async with async_session() as session:
-        result = await session.execute(
-            select(Admin.role).where(Admin.telegram_id == user_id)
-        )
-        role = result.scalar_one_or_none()
-        return role or "user"  # agar topilmasa "user" qaytaradi
\ No newline at end of file
+    record = await _lookup(user_id)
+    return record[0] if record else "user"  # agar topilmasa "user" qaytaradi
+
+
+async def get_admin_place(user_id: int) -> str | None:
+    record = await _lookup(user_id)
+    return record[1] if record else None
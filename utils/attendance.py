@@ -0,0 +1,97 @@
+# utils/attendance.py
+from dataclasses import dataclass
+from datetime import datetime
+
+from sqlalchemy import select, update, func, literal
+from sqlalchemy.dialects.postgresql import insert
+
+from models import User, AttendanceLog, DailyStat, CashierStat, Outbox
+from utils.stats import local_day
+
+
+@dataclass
+class MarkResult:
+    telegram_id: int
+    first_name: str | None
+    # None — bugun shu joyda allaqachon belgilangan
+    marked_at: datetime | None
+
+    @property
+    def created(self) -> bool:
+        return self.marked_at is not None
+
+
+def mark_statement(condition, place: str, marked_by: int, notify: bool = True):
+    # Bitta so'rov: attendance insert (kun bo'yicha dedupe) -> users update -> rollup upsertlar -> outbox
+    day = local_day()
+    target = select(User.telegram_id, User.first_name, User.source).where(condition).cte("target")
+
+    inserted = (
+        insert(AttendanceLog)
+        .from_select(
+            ["user_id", "place", "marked_by", "visit_day"],
+            select(target.c.telegram_id, literal(place), literal(marked_by), literal(day))
+        )
+        .on_conflict_do_nothing(
+            index_elements=[AttendanceLog.user_id, AttendanceLog.place, AttendanceLog.visit_day]
+        )
+        .returning(AttendanceLog.user_id, AttendanceLog.marked_at)
+        .cte("inserted")
+    )
+
+    updated = (
+        update(User)
+        .where(User.telegram_id == inserted.c.user_id)
+        .values(attended=True, attended_date=inserted.c.marked_at, last_place=place)
+        .returning(User.telegram_id, User.first_name, User.source, inserted.c.marked_at)
+        .cte("updated")
+    )
+
+    source = func.coalesce(updated.c.source, "")
+    daily = insert(DailyStat).from_select(
+        ["day", "place", "source", "registrations", "visits"],
+        select(literal(day), literal(place), source, literal(0), func.count()).group_by(source)
+    )
+    daily = daily.on_conflict_do_update(
+        index_elements=[DailyStat.day, DailyStat.place, DailyStat.source],
+        set_={"visits": DailyStat.visits + daily.excluded.visits}
+    ).cte("daily_rollup")
+
+    cashier = insert(CashierStat).from_select(
+        ["day", "marked_by", "place", "visits"],
+        select(literal(day), literal(marked_by), literal(place), func.count())
+        .select_from(updated)
+        .having(func.count() > 0)
+    )
+    cashier = cashier.on_conflict_do_update(
+        index_elements=[CashierStat.day, CashierStat.marked_by, CashierStat.place],
+        set_={"visits": CashierStat.visits + cashier.excluded.visits}
+    ).cte("cashier_rollup")
+
+    ctes = [daily, cashier]
+    if notify:
+        # Tashrifchiga xabar shu tranzaksiyada navbatga qo'yiladi, fon dispatcher yuboradi
+        payload = func.json_build_object(
+            "first_name", updated.c.first_name,
+            "place", literal(place),
+            "marked_at", updated.c.marked_at
+        )
+        ctes.append(
+            insert(Outbox)
+            .from_select(["kind", "chat_id", "payload"], select(literal("attendance"), updated.c.telegram_id, payload))
+            .cte("outbox_rows")
+        )
+
+    # Topilgan har bir foydalanuvchi qaytadi; marked_at NULL — takroriy belgilash
+    return (
+        select(target.c.telegram_id, target.c.first_name, updated.c.marked_at)
+        .select_from(target.outerjoin(updated, updated.c.telegram_id == target.c.telegram_id))
+        .add_cte(*ctes)
+    )
+
+
+# Commit chaqiruvchi tomonda
+async def mark_attendance(session, condition, place: str, marked_by: int,
+                          notify: bool = True) -> list[MarkResult]:
+    result = await session.execute(mark_statement(condition, place, marked_by, notify))
+    return [MarkResult(*row) for row in result.all()]
@@ -0,0 +1,368 @@
+# utils/broadcast.py
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+
+from aiogram.exceptions import TelegramRetryAfter, TelegramForbiddenError, TelegramBadRequest
+from sqlalchemy import select, update, func, exists
+from sqlalchemy.dialects.postgresql import insert
+
+from config import BROADCAST_RATE, BROADCAST_WORKERS
+from database import async_session
+from models import User, BroadcastJob, BroadcastDelivery
+from utils.reachability import mark_unreachable
+from utils.segments import segment_filters, segment_label
+
+SENT = "sent"
+BLOCKED = "blocked"
+FAILED = "failed"
+
+# Telegram bitta chatga sekundiga ~1 ta xabarga ruxsat beradi
+CHAT_INTERVAL = 1.0
+
+
+class RateLimiter:
+    def __init__(self, rate: float, capacity: float | None = None, chat_interval: float = CHAT_INTERVAL):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.chat_interval = chat_interval
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+        self._chat_ready: dict[int, float] = {}
+
+    def pause(self, seconds: float):
+        # RetryAfter — butun bucket to'xtaydi, pauzadan keyin bo'sh holatdan boshlaydi
+        until = time.monotonic() + seconds
+        if until > self._paused_until:
+            self._paused_until = until
+        self._tokens = 0
+        self._updated = max(self._updated, self._paused_until)
+
+    async def acquire(self, chat_id: int | None = None):
+        if chat_id is not None:
+            await self._wait_chat(chat_id)
+
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+
+                elapsed = max(0.0, now - self._updated)
+                self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    async def _wait_chat(self, chat_id: int):
+        now = time.monotonic()
+        if len(self._chat_ready) > 10_000:
+            self._chat_ready = {k: v for k, v in self._chat_ready.items() if v > now}
+
+        ready = self._chat_ready.get(chat_id, 0.0)
+        self._chat_ready[chat_id] = max(now, ready) + self.chat_interval
+        if ready > now:
+            await asyncio.sleep(ready - now)
+
+
+# Broadcast va boshqa ommaviy yuborishlar uchun umumiy limiter
+limiter = RateLimiter(BROADCAST_RATE)
+
+
+@dataclass
+class BroadcastResult:
+    sent: int = 0
+    blocked: int = 0
+    failed: int = 0
+
+
+async def deliver(send, chat_id: int, *args, rate_limiter: RateLimiter = limiter) -> str:
+    while True:
+        await rate_limiter.acquire(chat_id)
+        try:
+            await send(chat_id, *args)
+            return SENT
+        except TelegramRetryAfter as e:
+            rate_limiter.pause(e.retry_after)
+        except TelegramForbiddenError:
+            return BLOCKED
+        except TelegramBadRequest as e:
+            if "chat not found" in e.message.lower():
+                return BLOCKED
+            return FAILED
+        except Exception:
+            return FAILED
+
+
+async def run_broadcast(receivers, send, workers: int = BROADCAST_WORKERS,
+                        rate_limiter: RateLimiter = limiter, on_result=None) -> BroadcastResult:
+    result = BroadcastResult()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=workers * 2)
+
+    async def worker():
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            status = await deliver(send, *item, rate_limiter=rate_limiter)
+            setattr(result, status, getattr(result, status) + 1)
+            if on_result is not None:
+                # Callback xatosi workerni o'ldirmasligi kerak
+                try:
+                    await on_result(item, status)
+                except Exception:
+                    logging.exception("Broadcast on_result xatosi")
+
+    tasks = [asyncio.create_task(worker()) for _ in range(workers)]
+
+    async def put(item):
+        if not queue.full():
+            queue.put_nowait(item)
+            return
+        # Navbat to'la: workerlar o'lgan bo'lsa producer abadiy kutib qolmaydi
+        putter = asyncio.ensure_future(queue.put(item))
+        done, _ = await asyncio.wait([putter, *tasks], return_when=asyncio.FIRST_COMPLETED)
+        if putter not in done:
+            putter.cancel()
+            dead = next(task for task in tasks if task.done())
+            raise dead.exception() or RuntimeError("Broadcast worker kutilmaganda to'xtadi")
+
+    try:
+        if hasattr(receivers, "__aiter__"):
+            async for item in receivers:
+                await put(item)
+        else:
+            for item in receivers:
+                await put(item)
+        for _ in tasks:
+            await put(None)
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    return result
+
+
+# ====================== FON BROADCAST JOBLARI ======================
+# Yangi job qo'shilganda worker darhol uyg'onadi
+job_added = asyncio.Event()
+
+AUDIENCE_CHUNK = 1000
+CHECKPOINT_SIZE = 200
+CHECKPOINT_INTERVAL = 5.0
+POLL_INTERVAL = 30.0
+FINAL_FLUSH_ATTEMPTS = 3
+
+
+def personalized_block(first_name, base_text: str) -> str:
+    name = first_name or "do'stimiz"
+    greeting = f"👋 Salom, {name}!"
+    return f"{greeting}\n\n{base_text}" if base_text else greeting
+
+
+async def iter_audience(filters: list, chunk_size: int = AUDIENCE_CHUNK):
+    # Keyset pagination (users.id bo'yicha): xotira tekis, sessiya faqat chunk vaqtida ochiq
+    after_id = 0
+    while True:
+        async with async_session() as session:
+            result = await session.execute(
+                select(User.id, User.telegram_id, User.first_name)
+                .where(*filters, User.id > after_id)
+                .order_by(User.id)
+                .limit(chunk_size)
+            )
+            rows = result.all()
+
+        for _, telegram_id, first_name in rows:
+            yield telegram_id, first_name
+
+        if len(rows) < chunk_size:
+            return
+        after_id = rows[-1].id
+
+
+class _JobProgress:
+    def __init__(self, bot, job: BroadcastJob):
+        self.bot = bot
+        self.job = job
+        self.sent = job.sent
+        self.blocked = job.blocked
+        self.failed = job.failed
+        self.processed = 0
+        self.started = time.monotonic()
+        self.last_flush = self.started
+        self.pending: list[dict] = []
+        self.lock = asyncio.Lock()
+        # Progress xabari tahririda RetryAfter — faqat tahrirlar to'xtaydi, yuborish limiteri emas
+        self.edits_paused_until = 0.0
+
+    @property
+    def remaining(self) -> int:
+        return max(0, self.job.total - self.sent - self.blocked - self.failed)
+
+    async def record(self, item, status: str):
+        self.pending.append({"job_id": self.job.id, "user_id": item[0], "status": status})
+        setattr(self, status, getattr(self, status) + 1)
+        self.processed += 1
+        # Checkpoint allaqachon ketayotgan bo'lsa, boshqa workerlar kutmaydi va takrorlamaydi
+        if self.lock.locked():
+            return
+        if len(self.pending) >= CHECKPOINT_SIZE or time.monotonic() - self.last_flush >= CHECKPOINT_INTERVAL:
+            try:
+                await self.flush()
+            except Exception:
+                # Qatorlar pending ga qaytarilgan, keyingi checkpointda yana yoziladi
+                logging.exception("Broadcast #%s checkpoint yozilmadi", self.job.id)
+
+    async def flush(self, status: str | None = None):
+        async with self.lock:
+            rows, self.pending = self.pending, []
+            unreachable = [row["user_id"] for row in rows if row["status"] == BLOCKED]
+            self.last_flush = time.monotonic()
+            values = {"sent": self.sent, "blocked": self.blocked, "failed": self.failed}
+            if status:
+                values["status"] = status
+                if status == "done":
+                    values["finished_at"] = func.now()
+
+            try:
+                async with async_session() as session:
+                    if rows:
+                        await session.execute(insert(BroadcastDelivery).values(rows).on_conflict_do_nothing())
+                    await mark_unreachable(session, unreachable)
+                    await session.execute(
+                        update(BroadcastJob).where(BroadcastJob.id == self.job.id).values(**values)
+                    )
+                    await session.commit()
+            except Exception:
+                self.pending = rows + self.pending
+                raise
+
+            await self.show(status)
+
+    def text(self, status: str | None = None) -> str:
+        elapsed = max(time.monotonic() - self.started, 0.001)
+        header = "✅ Yakunlandi" if status == "done" else "⏳ Yuborilmoqda"
+        return (
+            f"<b>Broadcast #{self.job.id}</b> — {header}\n"
+            f"Segment: {segment_label(self.job.segment)}\n\n"
+            f"Yuborildi: {self.sent} ta\n"
+            f"Bloklagan: {self.blocked} ta\n"
+            f"Xatolik: {self.failed} ta\n"
+            f"Qoldi: {self.remaining} ta\n"
+            f"Tezlik: {self.processed / elapsed:.1f} xabar/sek"
+        )
+
+    async def show(self, status: str | None = None):
+        if not self.job.progress_message_id:
+            return
+        wait = self.edits_paused_until - time.monotonic()
+        if wait > 0:
+            # Oraliq holatlar o'tkazib yuboriladi, yakuniy holat pauzadan keyin ko'rsatiladi
+            if status != "done":
+                return
+            await asyncio.sleep(wait)
+        try:
+            await self.bot.edit_message_text(
+                self.text(status),
+                chat_id=self.job.progress_chat_id,
+                message_id=self.job.progress_message_id,
+                parse_mode="HTML"
+            )
+        except TelegramRetryAfter as e:
+            self.edits_paused_until = time.monotonic() + e.retry_after
+        except TelegramBadRequest:
+            pass
+        except Exception:
+            # Progress xabari ikkinchi darajali — tarmoq xatosi yuborishni to'xtatmaydi
+            logging.warning("Broadcast #%s progress xabari yangilanmadi", self.job.id, exc_info=True)
+
+
+def _job_sender(bot, job: BroadcastJob):
+    async def send(uid, first_name):
+        if job.content_type == "text":
+            text = personalized_block(first_name, job.text or "")
+            await bot.send_message(uid, text, parse_mode="HTML")
+        else:
+            caption = personalized_block(first_name, job.text or "")
+            await bot.copy_message(
+                uid, job.source_chat_id, job.source_message_id,
+                caption=caption, parse_mode="HTML"
+            )
+    return send
+
+
+async def _run_job(bot, job: BroadcastJob):
+    filters = segment_filters(job.segment)
+    already_delivered = exists().where(
+        BroadcastDelivery.job_id == job.id,
+        BroadcastDelivery.user_id == User.telegram_id
+    )
+
+    async with async_session() as session:
+        values = {"status": "running", "started_at": func.coalesce(BroadcastJob.started_at, func.now())}
+        if job.status == "pending" and not job.total:
+            job.total = await session.scalar(select(func.count(User.id)).where(*filters))
+            values["total"] = job.total
+        await session.execute(update(BroadcastJob).where(BroadcastJob.id == job.id).values(**values))
+        await session.commit()
+
+    progress = _JobProgress(bot, job)
+    await progress.show()
+    await run_broadcast(
+        iter_audience([*filters, ~already_delivered]),
+        _job_sender(bot, job),
+        on_result=progress.record
+    )
+    # Yakuniy checkpoint yozilmasa job "running" qoladi va restartdan keyin davom etadi
+    for attempt in range(FINAL_FLUSH_ATTEMPTS):
+        try:
+            await progress.flush(status="done")
+            return
+        except Exception:
+            if attempt == FINAL_FLUSH_ATTEMPTS - 1:
+                raise
+            logging.exception("Broadcast #%s yakuniy checkpoint, qayta urinish", job.id)
+            await asyncio.sleep(CHECKPOINT_INTERVAL)
+
+
+async def _next_job() -> BroadcastJob | None:
+    async with async_session() as session:
+        return await session.scalar(
+            select(BroadcastJob)
+            .where(BroadcastJob.status.in_(("pending", "running")))
+            .order_by(BroadcastJob.id)
+            .limit(1)
+        )
+
+
+async def broadcast_worker(bot):
+    # "running" holatida qolgan joblar (restartdan keyin) to'xtagan joyidan davom etadi
+    while True:
+        job_added.clear()
+        job = await _next_job()
+        if job is None:
+            try:
+                await asyncio.wait_for(job_added.wait(), POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            continue
+
+        try:
+            await _run_job(bot, job)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logging.exception("Broadcast job #%s bajarilmadi", job.id)
+            async with async_session() as session:
+                await session.execute(
+                    update(BroadcastJob).where(BroadcastJob.id == job.id).values(status="failed")
+                )
+                await session.commit()
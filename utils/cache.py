@@ -0,0 +1,58 @@
+# utils/cache.py
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    # LRU + TTL: eng eski ishlatilgan yozuv maxsize oshganda chiqariladi
+    def __init__(self, maxsize: int = 128, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict = OrderedDict()
+
+    def get(self, key, default=None):
+        item = self._data.get(key)
+        if item is None or item[0] < time.monotonic():
+            if item is not None:
+                del self._data[key]
+            self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return item[1]
+
+    def set(self, key, value, ttl: float | None = None):
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (expires, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    async def get_or_load(self, key, loader):
+        value = self.get(key)
+        if value is None:
+            value = await loader()
+            self.set(key, value)
+        return value
+
+    def pop(self, key, default=None):
+        item = self._data.pop(key, None)
+        return default if item is None else item[1]
+
+    def invalidate(self, predicate=None):
+        if predicate is None:
+            self._data.clear()
+            return
+        for key in [k for k in self._data if predicate(k)]:
+            del self._data[key]
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> str:
+        total = self.hits + self.misses
+        ratio = self.hits / total * 100 if total else 0.0
+        return f"hit {self.hits} / miss {self.misses} ({ratio:.0f}%)"
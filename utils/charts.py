@@ -0,0 +1,140 @@
+# utils/charts.py
+from datetime import date, timedelta
+from io import BytesIO
+
+BG = (255, 255, 255)
+INK = (26, 26, 26)
+GRID = (225, 228, 235)
+HEAT_LOW = (239, 244, 252)
+HEAT_HIGH = (31, 78, 145)
+LINE_COLORS = [
+    (79, 129, 189), (192, 80, 77), (155, 187, 89),
+    (128, 100, 162), (75, 172, 198), (247, 150, 70)
+]
+TOP_PLACES = 5
+
+
+def _font(size: int):
+    from PIL import ImageFont
+    return ImageFont.load_default(size=size)
+
+
+def _mix(low, high, ratio: float):
+    return tuple(int(l + (h - l) * ratio) for l, h in zip(low, high))
+
+
+def _png(img) -> bytes:
+    buffer = BytesIO()
+    img.save(buffer, "PNG", optimize=True)
+    return buffer.getvalue()
+
+
+def aggregate(rows, start: date, days: int, tz_name: str):
+    import numpy as np
+    import pandas as pd
+
+    df = pd.DataFrame(rows, columns=["place", "marked_at"])
+    local = pd.to_datetime(df["marked_at"], utc=True).dt.tz_convert(tz_name)
+    df["hour"] = local.dt.hour
+    df["day"] = local.dt.date
+
+    # joy x soat matritsasi (0..23 ustunlar har doim bor)
+    heat = pd.crosstab(df["place"], df["hour"]).reindex(columns=np.arange(24), fill_value=0)
+    heat = heat.loc[heat.sum(axis=1).sort_values(ascending=False).index]
+
+    # kunlik trend: top joylar + jami
+    all_days = [start + timedelta(days=i) for i in range(days)]
+    daily = pd.crosstab(df["day"], df["place"]).reindex(all_days, fill_value=0)
+    top = daily.sum().sort_values(ascending=False).index[:TOP_PLACES]
+    trend = daily[top].copy()
+    trend["Jami"] = daily.sum(axis=1)
+    return heat, trend
+
+
+def render_heatmap(heat, title: str) -> bytes:
+    from PIL import Image, ImageDraw
+
+    cell_w, cell_h = 34, 28
+    left, top, right, bottom = 150, 70, 20, 20
+    width = left + cell_w * 24 + right
+    height = top + cell_h * max(len(heat.index), 1) + bottom
+
+    img = Image.new("RGB", (width, height), BG)
+    draw = ImageDraw.Draw(img)
+    draw.text((left, 12), title, fill=INK, font=_font(18))
+
+    small = _font(11)
+    for hour in range(24):
+        draw.text((left + hour * cell_w + cell_w / 2, top - 14), f"{hour:02d}", fill=INK, font=small, anchor="mm")
+
+    peak = int(heat.values.max()) if heat.size else 0
+    for row_idx, place in enumerate(heat.index):
+        y = top + row_idx * cell_h
+        draw.text((left - 8, y + cell_h / 2), str(place)[:20], fill=INK, font=_font(12), anchor="rm")
+        for hour, value in enumerate(heat.loc[place].to_numpy()):
+            x = left + hour * cell_w
+            ratio = value / peak if peak else 0
+            draw.rectangle([x, y, x + cell_w - 2, y + cell_h - 2], fill=_mix(HEAT_LOW, HEAT_HIGH, ratio))
+            if value:
+                color = BG if ratio > 0.55 else INK
+                draw.text((x + cell_w / 2 - 1, y + cell_h / 2 - 1), str(int(value)), fill=color, font=small, anchor="mm")
+
+    return _png(img)
+
+
+def render_trend(trend, title: str) -> bytes:
+    from PIL import Image, ImageDraw
+
+    width, height = 960, 460
+    left, top, right, bottom = 60, 60, 180, 50
+    plot_w, plot_h = width - left - right, height - top - bottom
+
+    img = Image.new("RGB", (width, height), BG)
+    draw = ImageDraw.Draw(img)
+    draw.text((left, 14), title, fill=INK, font=_font(18))
+
+    small = _font(11)
+    peak = max(int(trend.values.max()) if trend.size else 0, 1)
+    for step in range(5):
+        value = peak * step / 4
+        y = top + plot_h - plot_h * step / 4
+        draw.line([left, y, left + plot_w, y], fill=GRID)
+        draw.text((left - 6, y), f"{value:.0f}", fill=INK, font=small, anchor="rm")
+
+    days = list(trend.index)
+    span = max(len(days) - 1, 1)
+    label_every = max(len(days) // 10, 1)
+    for i, day in enumerate(days):
+        if i % label_every == 0:
+            x = left + plot_w * i / span
+            draw.text((x, top + plot_h + 14), day.strftime("%d.%m"), fill=INK, font=small, anchor="mm")
+
+    for idx, column in enumerate(trend.columns):
+        color = INK if column == "Jami" else LINE_COLORS[idx % len(LINE_COLORS)]
+        values = trend[column].to_numpy()
+        points = [
+            (left + plot_w * i / span, top + plot_h - plot_h * v / peak)
+            for i, v in enumerate(values)
+        ]
+        if len(points) > 1:
+            draw.line(points, fill=color, width=3 if column == "Jami" else 2)
+        else:
+            x, y = points[0]
+            draw.ellipse([x - 3, y - 3, x + 3, y + 3], fill=color)
+
+        legend_y = top + idx * 20
+        draw.rectangle([width - right + 16, legend_y + 4, width - right + 30, legend_y + 14], fill=color)
+        draw.text((width - right + 36, legend_y + 9), str(column)[:18], fill=INK, font=_font(12), anchor="lm")
+
+    return _png(img)
+
+
+# Process poolda ishlaydi: agregatsiya (pandas) + chizish (Pillow)
+def render_charts(rows, start: date, days: int, tz_name: str) -> tuple[bytes, bytes]:
+    heat, trend = aggregate(rows, start, days, tz_name)
+    end = start + timedelta(days=days - 1)
+    period = f"{start.strftime('%d.%m.%Y')} - {end.strftime('%d.%m.%Y')}"
+    return (
+        render_heatmap(heat, f"Tashriflar: joy va soat bo'yicha ({period})"),
+        render_trend(trend, f"Kunlik tashriflar ({period})")
+    )
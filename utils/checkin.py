@@ -0,0 +1,35 @@
+# utils/checkin.py
+import base64
+import hashlib
+import hmac
+
+from config import CHECKIN_SECRET
+
+PREFIX = "ci_"
+SIGNATURE_BYTES = 12
+
+
+def _sign(user_id: int) -> str:
+    digest = hmac.new(CHECKIN_SECRET.encode(), f"checkin:{user_id}".encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest[:SIGNATURE_BYTES]).decode().rstrip("=")
+
+
+def make_token(user_id: int) -> str:
+    # users.id + HMAC imzo; deep link parametri sifatida (<= 64 belgi, [A-Za-z0-9_-])
+    return f"{PREFIX}{user_id}-{_sign(user_id)}"
+
+
+def verify_token(token: str) -> int | None:
+    # Jadval o'qilmaydi: imzo to'g'ri bo'lsa users.id qaytadi
+    if not token.startswith(PREFIX):
+        return None
+    user_id, _, signature = token[len(PREFIX):].partition("-")
+    if not user_id.isdigit() or len(user_id) > 18:
+        return None
+    if not hmac.compare_digest(signature, _sign(int(user_id))):
+        return None
+    return int(user_id)
+
+
+def checkin_link(bot_username: str, user_id: int) -> str:
+    return f"https://t.me/{bot_username}?start={make_token(user_id)}"
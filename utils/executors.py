@@ -0,0 +1,50 @@
+# utils/executors.py
+import asyncio
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from functools import partial
+
+from config import POOL_WORKERS
+
+_thread_pool: ThreadPoolExecutor | None = None
+_process_pool: ProcessPoolExecutor | None = None
+
+
+def _threads() -> ThreadPoolExecutor:
+    global _thread_pool
+    if _thread_pool is None:
+        _thread_pool = ThreadPoolExecutor(max_workers=POOL_WORKERS * 2, thread_name_prefix="io")
+    return _thread_pool
+
+
+def _processes() -> ProcessPoolExecutor:
+    global _process_pool
+    if _process_pool is None:
+        # spawn: thread pool bilan birga fork qilish xavfsiz emas
+        _process_pool = ProcessPoolExecutor(
+            max_workers=POOL_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _process_pool
+
+
+# Fayl/disk ishlari — thread pool
+async def run_io(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_threads(), partial(func, *args, **kwargs))
+
+
+# Og'ir CPU ishlari (Excel, rasm) — process pool, event loop bloklanmaydi
+async def run_cpu(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_processes(), partial(func, *args, **kwargs))
+
+
+def shutdown_executors():
+    global _thread_pool, _process_pool
+    if _thread_pool is not None:
+        _thread_pool.shutdown(wait=False, cancel_futures=True)
+        _thread_pool = None
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
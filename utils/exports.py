@@ -0,0 +1,310 @@
+# utils/exports.py
+import gzip
+import os
+import pickle
+import tempfile
+from dataclasses import dataclass
+from typing import Callable
+from datetime import datetime
+from io import BytesIO
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, Alignment, PatternFill
+from openpyxl.utils import get_column_letter
+from sqlalchemy import select, func
+from sqlalchemy.dialects.postgresql import insert
+
+from models import User, AttendanceLog, ExportWatermark
+from utils.cache import TTLCache
+from utils.executors import run_io, run_cpu
+
+EXPORT_CHUNK = 1000
+
+FORMATS = {
+    "xlsx": "Excel (.xlsx)",
+    "csv": "CSV.gz",
+    "parquet": "Parquet"
+}
+EXTENSIONS = {"xlsx": "xlsx", "csv": "csv.gz", "parquet": "parquet"}
+
+# (tur, format, watermark) -> CachedExport; versiya (manba jadval max id) o'zgarsa eskiradi
+export_cache = TTLCache(maxsize=32, ttl=6 * 3600)
+
+
+class XlsxStreamWriter:
+    # write_only rejimida ustun kengliklari birinchi qatordan oldin berilishi kerak,
+    # shuning uchun ular dastlabki `sample_size` qatordan taxmin qilinadi
+    def __init__(self, headers, title="FamilyPark", sample_size=500, max_width=60):
+        self.wb = Workbook(write_only=True)
+        self.ws = self.wb.create_sheet(title)
+        self.headers = headers
+        self.widths = [len(str(h)) for h in headers]
+        self.sample_size = sample_size
+        self.max_width = max_width
+        self.rows = 0
+        self._sample = []
+
+    def append(self, row):
+        self.rows += 1
+        if self._sample is None:
+            self.ws.append(row)
+            return
+
+        self._sample.append(row)
+        for i, value in enumerate(row):
+            self.widths[i] = max(self.widths[i], len(str(value)) if value is not None else 0)
+        if len(self._sample) >= self.sample_size:
+            self._flush_sample()
+
+    def _flush_sample(self):
+        for i, width in enumerate(self.widths, start=1):
+            self.ws.column_dimensions[get_column_letter(i)].width = min(width + 2, self.max_width)
+
+        header = []
+        for value in self.headers:
+            cell = WriteOnlyCell(self.ws, value=value)
+            cell.font = Font(bold=True, color="FFFFFF")
+            cell.fill = PatternFill("solid", fgColor="4F81BD")
+            cell.alignment = Alignment(horizontal="center", vertical="center")
+            header.append(cell)
+        self.ws.append(header)
+
+        for row in self._sample:
+            self.ws.append(row)
+        self._sample = None
+
+    def save(self, buffer):
+        if self._sample is not None:
+            self._flush_sample()
+        self.wb.save(buffer)
+
+
+# Har bir eksport turi: xom ustunlar (CSV/Parquet uchun) va Excel ko'rinishi.
+# Xom qatorning birinchi ustuni — manba jadval id si (watermark uchun).
+USER_COLUMNS = ["id", "telegram_id", "first_name", "username", "phone", "source", "registered_at"]
+USER_HEADERS = ["#", "Telegram ID", "Ism", "Username", "Telefon", "Source", "Ro'yxatdan o'tgan vaqti"]
+
+ATTENDANCE_COLUMNS = ["id", "user_id", "first_name", "phone", "place", "marked_by", "marked_at"]
+ATTENDANCE_HEADERS = ["№", "Ism", "Telefon", "Joy", "Kelgan vaqti"]
+
+
+def _user_xlsx_row(idx, row):
+    _, telegram_id, first_name, username, phone, source, registered_at = row
+    return [
+        idx,
+        telegram_id,
+        first_name or "-",
+        f"@{username}" if username else "-",
+        phone,
+        source,
+        registered_at.strftime("%d.%m.%Y %H:%M") if registered_at else "-"
+    ]
+
+
+def _attendance_xlsx_row(idx, row):
+    _, _, first_name, phone, place, _, marked_at = row
+    return [idx, first_name, phone, place, marked_at.strftime("%Y-%m-%d %H:%M")]
+
+
+def _users_query(after_id: int):
+    return (
+        select(
+            User.id, User.telegram_id, User.first_name, User.username,
+            User.phone, User.source, User.registered_at
+        )
+        .where(User.id > after_id)
+        .order_by(User.id)
+    )
+
+
+def _attendance_query(after_id: int):
+    return (
+        select(
+            AttendanceLog.id, AttendanceLog.user_id, User.first_name, User.phone,
+            AttendanceLog.place, AttendanceLog.marked_by, AttendanceLog.marked_at
+        )
+        .join(User, AttendanceLog.user_id == User.telegram_id)
+        .where(AttendanceLog.id > after_id)
+        .order_by(AttendanceLog.id)
+    )
+
+
+@dataclass(frozen=True)
+class ExportSpec:
+    title: str
+    file_prefix: str
+    columns: list
+    headers: list
+    xlsx_row: Callable
+    query: Callable
+    id_column: object
+
+
+EXPORTS = {
+    "users": ExportSpec("FamilyPark", "FamilyPark", USER_COLUMNS, USER_HEADERS,
+                        _user_xlsx_row, _users_query, User.id),
+    "attendance": ExportSpec("Attendance", "attendance", ATTENDANCE_COLUMNS, ATTENDANCE_HEADERS,
+                             _attendance_xlsx_row, _attendance_query, AttendanceLog.id),
+}
+
+
+def _parquet_schema(kind: str):
+    import pyarrow as pa
+
+    ts = pa.timestamp("us", tz="UTC")
+    if kind == "users":
+        return pa.schema([
+            ("id", pa.int64()), ("telegram_id", pa.int64()), ("first_name", pa.string()),
+            ("username", pa.string()), ("phone", pa.string()), ("source", pa.string()),
+            ("registered_at", ts)
+        ])
+    return pa.schema([
+        ("id", pa.int64()), ("user_id", pa.int64()), ("first_name", pa.string()),
+        ("phone", pa.string()), ("place", pa.string()), ("marked_by", pa.int64()),
+        ("marked_at", ts)
+    ])
+
+
+def _read_spool(spool_path: str):
+    with open(spool_path, "rb") as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+# ---------- Process poolda ishlaydigan builderlar ----------
+def build_xlsx(spool_path: str, kind: str) -> bytes:
+    spec = EXPORTS[kind]
+    writer = XlsxStreamWriter(spec.headers, title=spec.title)
+    idx = 0
+    for chunk in _read_spool(spool_path):
+        for row in chunk:
+            idx += 1
+            writer.append(spec.xlsx_row(idx, row))
+
+    buffer = BytesIO()
+    writer.save(buffer)
+    return buffer.getvalue()
+
+
+def build_csv_gz(spool_path: str, kind: str) -> bytes:
+    import pandas as pd
+
+    columns = EXPORTS[kind].columns
+    buffer = BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode="wb") as gz:
+        header = True
+        for chunk in _read_spool(spool_path):
+            df = pd.DataFrame(chunk, columns=columns)
+            gz.write(df.to_csv(index=False, header=header).encode("utf-8"))
+            header = False
+        if header:
+            gz.write((",".join(columns) + "\n").encode("utf-8"))
+    return buffer.getvalue()
+
+
+def build_parquet(spool_path: str, kind: str) -> bytes:
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    columns = EXPORTS[kind].columns
+    schema = _parquet_schema(kind)
+    buffer = BytesIO()
+    with pq.ParquetWriter(buffer, schema, compression="zstd") as writer:
+        for chunk in _read_spool(spool_path):
+            df = pd.DataFrame(chunk, columns=columns)
+            writer.write_table(pa.Table.from_pandas(df, schema=schema, preserve_index=False))
+    return buffer.getvalue()
+
+
+BUILDERS = {"xlsx": build_xlsx, "csv": build_csv_gz, "parquet": build_parquet}
+
+
+# ---------- Async tomoni ----------
+async def spool_rows(session, stmt) -> tuple[str, int, int]:
+    spool = tempfile.NamedTemporaryFile(prefix="familypark_", suffix=".rows", delete=False)
+    count = 0
+    last_id = 0
+    try:
+        result = await session.stream(stmt.execution_options(yield_per=EXPORT_CHUNK))
+        async for partition in result.partitions():
+            rows = [tuple(row) for row in partition]
+            count += len(rows)
+            last_id = rows[-1][0]
+            await run_io(pickle.dump, rows, spool)
+    finally:
+        await run_io(spool.close)
+    return spool.name, count, last_id
+
+
+@dataclass
+class ExportResult:
+    data: bytes
+    filename: str
+    count: int
+    last_id: int
+
+
+async def build_export(async_session, kind: str, fmt: str, after_id: int = 0) -> ExportResult:
+    # DB -> spool fayl (server-side cursor), keyin fayl alohida processda quriladi
+    spec = EXPORTS[kind]
+    async with async_session() as session:
+        path, count, last_id = await spool_rows(session, spec.query(after_id))
+    try:
+        data = await run_cpu(BUILDERS[fmt], path, kind) if count else b""
+    finally:
+        await run_io(os.remove, path)
+
+    suffix = "_delta" if after_id else ""
+    filename = f"{spec.file_prefix}_{datetime.now().strftime('%Y-%m-%d_%H-%M')}{suffix}.{EXTENSIONS[fmt]}"
+    return ExportResult(data, filename, count, last_id or after_id)
+
+
+@dataclass
+class CachedExport:
+    version: int
+    file_id: str
+    count: int
+    last_id: int
+
+
+async def data_version(session, kind: str) -> int:
+    # Jadvallarga faqat qo'shiladi, shuning uchun max(id) (PK indeksidan) versiya bo'la oladi
+    return await session.scalar(select(func.max(EXPORTS[kind].id_column))) or 0
+
+
+def get_cached_export(kind: str, fmt: str, after_id: int, version: int) -> CachedExport | None:
+    key = (kind, fmt, after_id)
+    cached = export_cache.get(key)
+    if cached is not None and cached.version != version:
+        export_cache.pop(key)
+        return None
+    return cached
+
+
+def store_cached_export(kind: str, fmt: str, after_id: int, cached: CachedExport):
+    export_cache.set((kind, fmt, after_id), cached)
+
+
+async def get_watermark(session, admin_id: int, kind: str) -> int:
+    last_id = await session.scalar(
+        select(ExportWatermark.last_id).where(
+            ExportWatermark.admin_id == admin_id,
+            ExportWatermark.export_type == kind
+        )
+    )
+    return last_id or 0
+
+
+async def save_watermark(session, admin_id: int, kind: str, last_id: int):
+    stmt = insert(ExportWatermark).values(admin_id=admin_id, export_type=kind, last_id=last_id)
+    await session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[ExportWatermark.admin_id, ExportWatermark.export_type],
+            set_={"last_id": func.greatest(ExportWatermark.last_id, stmt.excluded.last_id), "updated_at": func.now()}
+        )
+    )
@@ -0,0 +1,82 @@
+# utils/membership.py
+import hashlib
+import math
+
+from sqlalchemy import select
+
+from config import MEMBERSHIP_MODE, MEMBERSHIP_CAPACITY
+from database import async_session
+from models import User
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, value: int):
+        digest = hashlib.blake2b(value.to_bytes(8, "big", signed=True), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "big")
+        h2 = int.from_bytes(digest[8:], "big") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, value: int):
+        for pos in self._positions(value):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, value: int) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(value))
+
+
+class Membership:
+    # check(): True/False — aniq javob, None — DB dan so'rash kerak
+    def __init__(self, mode: str = MEMBERSHIP_MODE, capacity: int = MEMBERSHIP_CAPACITY):
+        self.mode = mode
+        self.capacity = capacity
+        self.loaded = False
+        self._members = BloomFilter(capacity) if mode == "bloom" else set()
+
+    def add(self, telegram_id: int):
+        self._members.add(telegram_id)
+
+    def check(self, telegram_id: int) -> bool | None:
+        if not self.loaded:
+            return None
+        if telegram_id not in self._members:
+            return False
+        # Bloom filterda musbat javob ehtimoliy
+        return True if self.mode != "bloom" else None
+
+    async def load(self, chunk_size: int = 10_000):
+        members = BloomFilter(self.capacity) if self.mode == "bloom" else set()
+        async with async_session() as session:
+            result = await session.stream(
+                select(User.telegram_id).execution_options(yield_per=chunk_size)
+            )
+            async for partition in result.partitions():
+                for (telegram_id,) in partition:
+                    members.add(telegram_id)
+
+        # Yuklash paytida qo'shilganlar yo'qolmasligi uchun
+        if self.mode != "bloom":
+            members |= self._members
+        self._members = members
+        self.loaded = True
+
+
+members = Membership()
+
+
+async def is_registered(telegram_id: int) -> bool:
+    known = members.check(telegram_id)
+    if known is not None:
+        return known
+
+    async with async_session() as session:
+        found = await session.scalar(
+            select(User.telegram_id).where(User.telegram_id == telegram_id)
+        )
+    if found is not None:
+        members.add(telegram_id)
+    return found is not None
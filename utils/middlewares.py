@@ -0,0 +1,29 @@
+# utils/middlewares.py
+from aiogram import BaseMiddleware
+from aiogram.types import Update
+
+from utils.admin_check import get_role, get_admin_place
+from utils.reachability import unreachable_ids, mark_reachable
+
+
+class ReachabilityMiddleware(BaseMiddleware):
+    # Foydalanuvchi botga qayta yozsa, "unreachable" belgisi olib tashlanadi
+    async def __call__(self, handler, event: Update, data: dict):
+        user = data.get("event_from_user")
+        talked = event.message or event.callback_query or event.inline_query
+        if talked and user is not None and user.id in unreachable_ids:
+            await mark_reachable(user.id)
+        return await handler(event, data)
+
+
+class RoleMiddleware(BaseMiddleware):
+    # Rol har bir update uchun bir marta, xotiradagi keshdan aniqlanadi va handlerlarga uzatiladi
+    async def __call__(self, handler, event: Update, data: dict):
+        user = data.get("event_from_user")
+        if user is not None:
+            data["role"] = await get_role(user.id)
+            data["admin_place"] = await get_admin_place(user.id)
+        else:
+            data["role"] = "user"
+            data["admin_place"] = None
+        return await handler(event, data)
@@ -1,97 +1,89 @@
 # utils/misc.py
+from io import BytesIO
+
 import qrcode
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment,PatternFill
-from datetime import datetime
-import os
-from models import *
-from sqlalchemy import select
-
-def generate_qr(link: str, filename: str = "qr_temp.png"):
-    qr = qrcode.QRCode(box_size=12, border=5)
+
+from utils.cache import TTLCache
+from utils.executors import run_cpu
+
+QR_STYLES = {
+    "default": {"box_size": 12, "border": 5, "fill_color": "#1a1a1a", "back_color": "white"},
+    # Chop etish uchun: kattaroq modul, yuqori xatolikka chidamlilik
+    "print": {"box_size": 20, "border": 4, "fill_color": "black", "back_color": "white",
+              "error_correction": qrcode.constants.ERROR_CORRECT_H},
+}
+
+# (link, style) -> PNG bytes
+qr_cache = TTLCache(maxsize=256, ttl=24 * 3600)
+
+
+def generate_qr(link: str, style: str = "default") -> bytes:
+    options = QR_STYLES[style]
+    qr = qrcode.QRCode(
+        box_size=options["box_size"],
+        border=options["border"],
+        error_correction=options.get("error_correction", qrcode.constants.ERROR_CORRECT_M)
+    )
     qr.add_data(link)
     qr.make(fit=True)
-    img = qr.make_image(fill_color="#1a1a1a", back_color="white")
-    img.save(filename)
-    return filename
-
-def create_excel(users, headers=None):
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "FamilyPark "
-
-    if headers is None:
-        headers = ["#", "Telegram ID", "Ism", "Username", "Telefon", "Source", "Ro'yxatdan o'tgan vaqti"]
-
-    ws.append(headers)
-    for cell in ws[1]:
-        cell.font = Font(bold=True, color="FFFFFF")
-        cell.fill = PatternFill("solid", fgColor="4F81BD")  
-        cell.alignment = Alignment(horizontal="center", vertical="center")
-
-    for idx, user in enumerate(users, start=1):
-        row = [
-            idx,
-            user.telegram_id,
-            user.first_name or "-",
-            f"@{user.username}" if user.username else "-",
-            user.phone,
-            user.source,
-            user.registered_at.strftime("%d.%m.%Y %H:%M")
-        ]
-        ws.append(row)
-
-        cell = ws.cell(row=idx + 1, column=8)
-        cell.alignment = Alignment(horizontal="center", vertical="center")
-
-    for column_cells in ws.columns:
-        max_length = max(len(str(cell.value)) if cell.value else 0 for cell in column_cells)
-        ws.column_dimensions[column_cells[0].column_letter].width = max_length + 2
-
-    filename = f"FamilyPark_{datetime.now().strftime('%Y-%m-%d_%H-%M')}.xlsx"
-    wb.save(filename)
-    return filename
-
-
-async def export_attendance_excel(async_session):
-    async with async_session() as session:
-        result = await session.execute(
-            select(
-                User.first_name,
-                User.phone,
-                AttendanceLog.place,
-                AttendanceLog.marked_at
-            ).join(AttendanceLog, AttendanceLog.user_id == User.telegram_id)
-        )
-        data = result.all()  
-    
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Attendance"
-    headers = ["№", "Ism", "Telefon", "Joy", "Kelgan vaqti"]
-
-    bold_font = Font(bold=True, color="FFFFFF")
-    fill = PatternFill(start_color="4F81BD", end_color="4F81BD", fill_type="solid")
-    for col, header in enumerate(headers, start=1):
-        cell = ws.cell(row=1, column=col, value=header)
-        cell.font = bold_font
-        cell.fill = fill
-        cell.alignment = Alignment(horizontal="center")
-
-    for row_num, row_data in enumerate(data, start=2):
-        first_name, phone, place, marked_at = row_data
-        ws.cell(row=row_num, column=1, value=row_num-1)
-        ws.cell(row=row_num, column=2, value=first_name)
-        ws.cell(row=row_num, column=3, value=phone)
-        ws.cell(row=row_num, column=4, value=place)
-        ws.cell(row=row_num, column=5, value=marked_at.strftime("%Y-%m-%d %H:%M"))
-
-    for column in ws.columns:
-        max_length = max(len(str(cell.value)) if cell.value else 0 for cell in column)
-        ws.column_dimensions[column[0].column_letter].width = max_length + 3
-
-    file_name = f"attendance_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-    file_path = f"/tmp/{file_name}"
-    wb.save(file_path)
-
-    return file_path
+    img = qr.make_image(fill_color=options["fill_color"], back_color=options["back_color"])
+    buffer = BytesIO()
+    img.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+async def render_qr(link: str, style: str = "default") -> bytes:
+    # Process poolda chiziladi, natija keshlanadi
+    return await qr_cache.get_or_load((link, style), lambda: run_cpu(generate_qr, link, style))
+
+
+# ---------- Barcha joylar uchun QR to'plami ----------
+PAGE_SIZE = (1240, 1754)  # A4, 150 dpi
+SHEET_COLUMNS, SHEET_ROWS = 2, 3
+
+
+def build_qr_zip(items: list[tuple[str, str, str, bytes]]) -> bytes:
+    import zipfile
+
+    buffer = BytesIO()
+    # PNG allaqachon siqilgan
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as archive:
+        for key, _, _, png in items:
+            archive.writestr(f"{key}.png", png)
+    return buffer.getvalue()
+
+
+def build_qr_pdf(items: list[tuple[str, str, str, bytes]]) -> bytes:
+    # Har sahifada 2x3 yorliqli QR, kesish chiziqlari bilan
+    from PIL import Image, ImageDraw, ImageFont
+
+    cell_w, cell_h = PAGE_SIZE[0] // SHEET_COLUMNS, PAGE_SIZE[1] // SHEET_ROWS
+    side = min(cell_w, cell_h) - 140
+    title_font = ImageFont.load_default(size=30)
+    small_font = ImageFont.load_default(size=18)
+    per_page = SHEET_COLUMNS * SHEET_ROWS
+
+    pages = []
+    for start in range(0, len(items), per_page):
+        page = Image.new("RGB", PAGE_SIZE, "white")
+        draw = ImageDraw.Draw(page)
+        for idx, (_, name, link, png) in enumerate(items[start:start + per_page]):
+            x = idx % SHEET_COLUMNS * cell_w
+            y = idx // SHEET_COLUMNS * cell_h
+            draw.rectangle([x, y, x + cell_w - 1, y + cell_h - 1], outline=(210, 210, 210))
+
+            qr = Image.open(BytesIO(png)).convert("RGB").resize((side, side), Image.NEAREST)
+            page.paste(qr, (x + (cell_w - side) // 2, y + 30))
+            draw.text((x + cell_w / 2, y + side + 65), name, fill="black", font=title_font, anchor="mm")
+            draw.text((x + cell_w / 2, y + side + 105), link, fill=(90, 90, 90), font=small_font, anchor="mm")
+        pages.append(page)
+
+    buffer = BytesIO()
+    pages[0].save(buffer, "PDF", save_all=True, append_images=pages[1:], resolution=150)
+    return buffer.getvalue()
+
+
+QR_BUNDLES = {
+    "zip": (build_qr_zip, "qr_kodlar.zip"),
+    "pdf": (build_qr_pdf, "qr_kodlar.pdf"),
+}
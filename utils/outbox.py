@@ -0,0 +1,153 @@
+# utils/outbox.py
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select, update, delete, func
+
+from config import TIMEZONE, BROADCAST_WORKERS
+from database import async_session
+from models import Outbox
+from utils.broadcast import run_broadcast, limiter, SENT, BLOCKED
+from utils.reachability import mark_unreachable
+
+# Yangi yozuv commit qilinganda dispatcher darhol uyg'onadi
+outbox_added = asyncio.Event()
+
+BATCH_SIZE = 50
+MAX_ATTEMPTS = 5
+POLL_INTERVAL = 10.0
+# Olingan batch shu vaqt ichida yakunlanmasa (masalan restart), qayta olinadi
+LEASE = timedelta(minutes=2)
+# Yakunlangan (sent/blocked/failed) yozuvlar shuncha saqlanadi, keyin o'chiriladi
+RETENTION = timedelta(days=7)
+CLEANUP_INTERVAL = 3600.0
+
+
+def _retry_delay(attempts: int) -> timedelta:
+    return timedelta(seconds=min(5 * 2 ** attempts, 600))
+
+
+def render_attendance(payload: dict) -> str:
+    marked_at = datetime.fromisoformat(payload["marked_at"]).astimezone(TIMEZONE)
+    return (
+        f"👋 Salom, {payload.get('first_name')}!\n\n"
+        f"✅ Siz muvaffaqiyatli ravishda quyidagi joyga keldingiz:\n"
+        f"🏢 Joy: <b>{payload['place']}</b>\n"
+        f"🕒 Vaqt: <b>{marked_at.strftime('%Y-%m-%d %H:%M:%S')}</b>\n\n"
+        f"Rahmat!"
+    )
+
+
+RENDERERS = {
+    "attendance": render_attendance,
+}
+
+
+async def _claim_batch() -> list[Outbox]:
+    # FOR UPDATE SKIP LOCKED: bir nechta dispatcher bir xil yozuvni olmaydi
+    async with async_session() as session:
+        claimable = (
+            select(Outbox.id)
+            .where(Outbox.status == "pending", Outbox.next_attempt_at <= func.now())
+            .order_by(Outbox.id)
+            .limit(BATCH_SIZE)
+            .with_for_update(skip_locked=True)
+        )
+        result = await session.execute(
+            update(Outbox)
+            .where(Outbox.id.in_(claimable.scalar_subquery()))
+            .values(next_attempt_at=func.now() + LEASE)
+            .returning(Outbox)
+        )
+        rows = list(result.scalars().all())
+        await session.commit()
+    return rows
+
+
+async def _dispatch(bot, rows: list[Outbox]):
+    now = datetime.now(timezone.utc)
+    changes: dict[int, dict] = {}
+    receivers = []
+    for row in rows:
+        renderer = RENDERERS.get(row.kind)
+        if renderer is None:
+            changes[row.id] = {"id": row.id, "status": "failed", "last_error": f"unknown kind: {row.kind}"}
+            continue
+        # Buzuq payload faqat o'z yozuvini failed qiladi, batchning qolgani yuboriladi
+        try:
+            text = renderer(row.payload)
+        except Exception as e:
+            logging.exception("Outbox #%s render qilinmadi", row.id)
+            changes[row.id] = {"id": row.id, "status": "failed", "last_error": f"render: {e!r}"[:200]}
+            continue
+        receivers.append((row.chat_id, text, row))
+
+    async def send(chat_id, text, _row):
+        await bot.send_message(chat_id, text, parse_mode="HTML")
+
+    async def on_result(item, status: str):
+        row = item[2]
+        if status == SENT:
+            changes[row.id] = {"id": row.id, "status": "sent", "sent_at": datetime.now(timezone.utc)}
+        elif status == BLOCKED:
+            changes[row.id] = {"id": row.id, "status": "blocked", "last_error": "blocked"}
+        else:
+            attempts = row.attempts + 1
+            changes[row.id] = {
+                "id": row.id,
+                "attempts": attempts,
+                "status": "failed" if attempts >= MAX_ATTEMPTS else "pending",
+                "next_attempt_at": now + _retry_delay(attempts),
+                "last_error": "send failed"
+            }
+
+    if receivers:
+        await run_broadcast(
+            receivers, send,
+            workers=min(len(receivers), BROADCAST_WORKERS),
+            rate_limiter=limiter,
+            on_result=on_result
+        )
+
+    blocked = [row.chat_id for row in rows if changes.get(row.id, {}).get("status") == "blocked"]
+    async with async_session() as session:
+        if changes:
+            await session.execute(update(Outbox), list(changes.values()))
+        await mark_unreachable(session, blocked)
+        await session.commit()
+
+
+async def _cleanup():
+    async with async_session() as session:
+        await session.execute(
+            delete(Outbox).where(
+                Outbox.status != "pending",
+                Outbox.created_at < func.now() - RETENTION
+            )
+        )
+        await session.commit()
+
+
+async def outbox_dispatcher(bot):
+    last_cleanup = 0.0
+    while True:
+        outbox_added.clear()
+        try:
+            if time.monotonic() - last_cleanup >= CLEANUP_INTERVAL:
+                last_cleanup = time.monotonic()
+                await _cleanup()
+            rows = await _claim_batch()
+            if rows:
+                await _dispatch(bot, rows)
+                continue
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logging.exception("Outbox batch yuborilmadi")
+
+        try:
+            await asyncio.wait_for(outbox_added.wait(), POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
@@ -0,0 +1,72 @@
+# utils/places.py
+import asyncio
+
+from sqlalchemy import select, update
+from sqlalchemy.dialects.postgresql import insert
+
+from database import async_session
+from models import Place
+
+# key -> name; joylar soni kichik, yaratilish tartibida xotirada saqlanadi
+_places: dict[str, str] = {}
+_qr_file_ids: dict[str, str] = {}
+_lock = asyncio.Lock()
+
+
+def default_name(key: str) -> str:
+    return key.replace("_", " ").title()
+
+
+async def load_places():
+    async with _lock:
+        async with async_session() as session:
+            result = await session.execute(select(Place.key, Place.name, Place.qr_file_id).order_by(Place.id))
+            rows = result.all()
+        _places.clear()
+        _places.update({key: name for key, name, _ in rows})
+        _qr_file_ids.clear()
+        _qr_file_ids.update({key: file_id for key, _, file_id in rows if file_id})
+
+
+def place_keys() -> list[str]:
+    return list(_places)
+
+
+def place_name(key: str) -> str:
+    return _places.get(key) or default_name(key)
+
+
+def place_exists(key: str) -> bool:
+    return key in _places
+
+
+def place_qr_file_id(key: str) -> str | None:
+    return _qr_file_ids.get(key)
+
+
+async def set_qr_file_id(key: str, file_id: str):
+    async with async_session() as session:
+        await session.execute(update(Place).where(Place.key == key).values(qr_file_id=file_id))
+        await session.commit()
+    _qr_file_ids[key] = file_id
+
+
+async def add_place(key: str, created_by: int | None = None, name: str | None = None) -> bool:
+    # Yangi joy qo'shilgan bo'lsa True
+    if key in _places:
+        return False
+    name = name or default_name(key)
+    async with async_session() as session:
+        result = await session.execute(
+            insert(Place)
+            .values(key=key, name=name, created_by=created_by)
+            .on_conflict_do_nothing(index_elements=[Place.key])
+            .returning(Place.key)
+        )
+        created = result.scalar_one_or_none() is not None
+        await session.commit()
+    if created:
+        _places[key] = name
+    else:
+        await load_places()
+    return created
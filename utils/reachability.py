@@ -0,0 +1,39 @@
+# utils/reachability.py
+from sqlalchemy import select, update, func
+
+from database import async_session
+from models import User
+
+# Yetib bo'lmaydigan foydalanuvchilar (telegram_id) — har bir update'da DB ga bormaslik uchun
+unreachable_ids: set[int] = set()
+
+
+async def load_unreachable():
+    async with async_session() as session:
+        result = await session.execute(
+            select(User.telegram_id).where(User.reachable.is_(False))
+        )
+        unreachable_ids.clear()
+        unreachable_ids.update(row[0] for row in result.all())
+
+
+async def mark_unreachable(session, telegram_ids: list[int]):
+    if not telegram_ids:
+        return
+    await session.execute(
+        update(User)
+        .where(User.telegram_id.in_(telegram_ids), User.reachable.is_(True))
+        .values(reachable=False, unreachable_at=func.now())
+    )
+    unreachable_ids.update(telegram_ids)
+
+
+async def mark_reachable(telegram_id: int):
+    async with async_session() as session:
+        await session.execute(
+            update(User)
+            .where(User.telegram_id == telegram_id)
+            .values(reachable=True, unreachable_at=None)
+        )
+        await session.commit()
+    unreachable_ids.discard(telegram_id)
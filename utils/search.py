@@ -0,0 +1,102 @@
+# utils/search.py
+import re
+
+from sqlalchemy import select, or_, case, literal, tuple_, func, cast, Integer
+
+from models import User
+
+SEARCH_LIMIT = 20
+FUZZY_MIN_LENGTH = 3
+
+# Natija tartibi: aniq ID -> telefon oxiri -> ism boshi -> ichida -> o'xshash
+RANK_EXACT_ID = 0
+RANK_PHONE_SUFFIX = 1
+RANK_PREFIX = 2
+RANK_CONTAINS = 3
+RANK_FUZZY = 4
+# O'xshashlik butun songa aylantiriladi — keyset offsetida aniq taqqoslanadi
+SIMILARITY_SCALE = 1000
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def normalize_query(query: str) -> tuple[str, str, bool]:
+    raw = query.strip()
+    username_only = raw.startswith("@")
+    text = raw.lstrip("@").lower()
+    digits = re.sub(r"\D", "", text) if re.fullmatch(r"[\d\s+()-]+", text) else ""
+    return text, digits, username_only
+
+
+def search_clauses(query: str):
+    # (where sharti, rank, score); tartib (rank, score, id) bo'yicha, qidirib bo'lmasa None
+    text, digits, username_only = normalize_query(query)
+
+    if digits:
+        pattern = _escape_like(digits)
+        # 2 raqamda trigram yo'q — faqat aniq Telegram ID bo'yicha
+        conditions = [User.phone_digits.like(f"%{pattern}%", escape="\\")] if len(digits) >= FUZZY_MIN_LENGTH else []
+        whens = []
+        if len(digits) <= 18:
+            conditions.append(User.telegram_id == int(digits))
+            whens.append((User.telegram_id == int(digits), RANK_EXACT_ID))
+        whens.append((User.phone_digits.like(f"%{pattern}", escape="\\"), RANK_PHONE_SUFFIX))
+        return or_(*conditions), case(*whens, else_=RANK_CONTAINS), literal(0)
+
+    if len(text) < 2:
+        return None
+
+    pattern = _escape_like(text)
+    columns = [User.username_lower] if username_only else [User.name_lower, User.username_lower]
+    if len(text) < FUZZY_MIN_LENGTH:
+        # Trigramsiz "%ab%" butun jadvalni o'qiydi — qisqa so'rovda faqat prefiks (varchar_pattern_ops btree)
+        conditions = [column.like(f"{pattern}%", escape="\\") for column in columns]
+    else:
+        # pg_trgm: "%...%" va "%" operatori GIN indeksdan foydalanadi
+        conditions = [column.like(f"%{pattern}%", escape="\\") for column in columns]
+        conditions += [column.op("%")(literal(text)) for column in columns]
+
+    rank = case(
+        (or_(*[column.like(f"{pattern}%", escape="\\") for column in columns]), RANK_PREFIX),
+        (or_(*[column.like(f"%{pattern}%", escape="\\") for column in columns]), RANK_CONTAINS),
+        else_=RANK_FUZZY
+    )
+    # O'xshash natijalar ichida eng yaqini birinchi (score o'sish tartibida, shuning uchun manfiy)
+    similarity = func.greatest(*[func.similarity(column, literal(text)) for column in columns])
+    score = case(
+        (rank == RANK_FUZZY, -cast(similarity * SIMILARITY_SCALE, Integer)),
+        else_=0
+    )
+    return or_(*conditions), rank, score
+
+
+def parse_offset(offset: str) -> tuple[int, int, int] | None:
+    # Inline offset: "<rank>:<score>:<users.id>" — oldingi sahifaning oxirgi qatori
+    try:
+        rank, score, user_id = offset.split(":")
+        return int(rank), int(score), int(user_id)
+    except ValueError:
+        return None
+
+
+async def search_users(session, query: str, limit: int = SEARCH_LIMIT,
+                       after: tuple[int, int, int] | None = None) -> tuple[list[User], str]:
+    # (sahifa, next_offset); keyset (rank, score, id) bo'yicha, oxirgi sahifada next_offset = ""
+    clauses = search_clauses(query)
+    if clauses is None:
+        return [], ""
+    condition, rank, score = clauses
+
+    stmt = select(User, rank.label("rank"), score.label("score")).where(condition)
+    if after is not None:
+        stmt = stmt.where(tuple_(rank, score, User.id) > tuple_(*[literal(value) for value in after]))
+    result = await session.execute(stmt.order_by(rank, score, User.id).limit(limit + 1))
+    rows = result.all()
+
+    next_offset = ""
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_offset = f"{rows[-1].rank}:{rows[-1].score}:{rows[-1].User.id}"
+    return [row.User for row in rows], next_offset
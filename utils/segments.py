@@ -0,0 +1,79 @@
+# utils/segments.py
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import select, func
+
+from config import TIMEZONE
+from models import User
+
+GENDER_LABELS = {"male": "Erkaklar", "female": "Ayollar"}
+ATTENDED_LABELS = {"yes": "Kelganlar", "no": "Hech kelmaganlar"}
+
+
+# Segment — oddiy dict: {"gender", "source", "attended", "reg_from", "reg_to", "place"}.
+# Har bir kalit alohida indeksli ustunga tushadi, filtrlar AND bilan birlashadi.
+def segment_filters(segment: dict | None) -> list:
+    segment = segment or {}
+    filters = [User.reachable.is_(True)]
+
+    if segment.get("gender"):
+        filters.append(User.gender == segment["gender"])
+    if segment.get("source"):
+        filters.append(User.source == segment["source"])
+    if segment.get("attended") == "yes":
+        filters.append(User.attended.is_(True))
+    elif segment.get("attended") == "no":
+        filters.append(User.attended.isnot(True))
+    if segment.get("reg_from"):
+        filters.append(User.registered_at >= _day_start(segment["reg_from"]))
+    if segment.get("reg_to"):
+        filters.append(User.registered_at < _day_start(segment["reg_to"]) + timedelta(days=1))
+    if segment.get("place"):
+        filters.append(User.last_place == segment["place"])
+
+    return filters
+
+
+def segment_label(segment: dict | None) -> str:
+    segment = segment or {}
+    parts = []
+    if segment.get("gender"):
+        parts.append(GENDER_LABELS.get(segment["gender"], segment["gender"]))
+    if segment.get("source"):
+        parts.append(f"Manba: {segment['source']}")
+    if segment.get("attended"):
+        parts.append(ATTENDED_LABELS.get(segment["attended"], segment["attended"]))
+    if segment.get("reg_from") or segment.get("reg_to"):
+        start = _fmt(segment.get("reg_from")) or "…"
+        end = _fmt(segment.get("reg_to")) or "…"
+        parts.append(f"Ro'yxatdan o'tgan: {start} — {end}")
+    if segment.get("place"):
+        parts.append(f"Oxirgi joy: {segment['place']}")
+    return " | ".join(parts) if parts else "Hamma"
+
+
+def segment_count_query(segment: dict | None):
+    return select(func.count(User.id)).where(*segment_filters(segment))
+
+
+def parse_date_range(text: str) -> tuple[date, date] | None:
+    # "01.09.2025-30.09.2025" yoki bitta sana
+    parts = [p.strip() for p in text.replace("—", "-").split("-") if p.strip()]
+    try:
+        days = [datetime.strptime(p, "%d.%m.%Y").date() for p in parts]
+    except ValueError:
+        return None
+    if len(days) == 1:
+        return days[0], days[0]
+    if len(days) == 2 and days[0] <= days[1]:
+        return days[0], days[1]
+    return None
+
+
+def _day_start(value: str) -> datetime:
+    # Park vaqti bo'yicha kun boshi — statistika va hisobotlar bilan bir xil
+    return datetime.combine(date.fromisoformat(value), datetime.min.time(), tzinfo=TIMEZONE)
+
+
+def _fmt(value: str | None) -> str | None:
+    return date.fromisoformat(value).strftime("%d.%m.%Y") if value else None
@@ -0,0 +1,135 @@
+# utils/stats.py
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import select, func, cast, Date, literal, null
+from sqlalchemy.dialects.postgresql import insert
+
+from config import TIMEZONE, TIMEZONE_NAME
+from database import async_session
+from models import User, Admin, AttendanceLog, DailyStat, CashierStat
+from utils.cache import TTLCache
+
+# Statistika / kassir hisobot natijalari; davomat yoki ro'yxatdan o'tish commitidan keyin tozalanadi
+dashboard_cache = TTLCache(maxsize=64, ttl=30)
+
+
+def invalidate_dashboard():
+    dashboard_cache.invalidate()
+
+
+def local_day(moment: datetime | None = None) -> date:
+    moment = moment or datetime.now(TIMEZONE)
+    return moment.astimezone(TIMEZONE).date()
+
+
+def _local_date(column):
+    # timestamptz -> park vaqtidagi sana
+    return cast(func.timezone(TIMEZONE_NAME, column), Date)
+
+
+async def _bump(session, place: str, source: str, registrations: int = 0, visits: int = 0):
+    stmt = insert(DailyStat).values(
+        day=local_day(), place=place or "", source=source or "",
+        registrations=registrations, visits=visits
+    )
+    await session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[DailyStat.day, DailyStat.place, DailyStat.source],
+            set_={
+                "registrations": DailyStat.registrations + stmt.excluded.registrations,
+                "visits": DailyStat.visits + stmt.excluded.visits
+            }
+        )
+    )
+
+
+# Commit chaqiruvchi tomonda — rollup asosiy yozuv bilan bitta tranzaksiyada
+async def record_registration(session, source: str):
+    await _bump(session, "", source, registrations=1)
+
+
+async def backfill_daily_stats():
+    async with async_session() as session:
+        if await session.scalar(select(DailyStat.day).limit(1)) is not None:
+            return
+
+        reg_day = _local_date(User.registered_at)
+        await session.execute(
+            insert(DailyStat).from_select(
+                ["day", "place", "source", "registrations", "visits"],
+                select(reg_day, literal(""), func.coalesce(User.source, ""), func.count(User.id), literal(0))
+                .where(User.registered_at.isnot(None))
+                .group_by(reg_day, User.source)
+            )
+        )
+
+        visit_day = _local_date(AttendanceLog.marked_at)
+        visits = (
+            insert(DailyStat).from_select(
+                ["day", "place", "source", "registrations", "visits"],
+                select(visit_day, AttendanceLog.place, func.coalesce(User.source, ""), literal(0), func.count(AttendanceLog.id))
+                .join(User, User.telegram_id == AttendanceLog.user_id)
+                .group_by(visit_day, AttendanceLog.place, User.source)
+            )
+        )
+        await session.execute(
+            visits.on_conflict_do_update(
+                index_elements=[DailyStat.day, DailyStat.place, DailyStat.source],
+                set_={"visits": DailyStat.visits + visits.excluded.visits}
+            )
+        )
+        await session.commit()
+
+
+async def backfill_cashier_stats():
+    async with async_session() as session:
+        if await session.scalar(select(CashierStat.day).limit(1)) is not None:
+            return
+
+        visit_day = _local_date(AttendanceLog.marked_at)
+        await session.execute(
+            insert(CashierStat).from_select(
+                ["day", "marked_by", "place", "visits"],
+                select(visit_day, AttendanceLog.marked_by, AttendanceLog.place, func.count(AttendanceLog.id))
+                .group_by(visit_day, AttendanceLog.marked_by, AttendanceLog.place)
+            )
+        )
+        await session.commit()
+
+
+def period_range(period: str, today: date | None = None) -> tuple[date, date]:
+    # [start, end) — park vaqti bo'yicha
+    today = today or local_day()
+    if period == "day":
+        return today, today + timedelta(days=1)
+    if period == "week":
+        start = today - timedelta(days=today.weekday())
+        return start, start + timedelta(days=7)
+    if period == "year":
+        start = today.replace(month=1, day=1)
+        return start, start.replace(year=start.year + 1)
+    start = today.replace(day=1)
+    return start, (start + timedelta(days=32)).replace(day=1)
+
+
+def year_ago(day: date) -> date:
+    try:
+        return day.replace(year=day.year - 1)
+    except ValueError:
+        return day.replace(year=day.year - 1, day=28)
+
+
+async def cashier_report_rows(session, start: date, end: date, group: str):
+    total = func.sum(CashierStat.visits)
+    if group == "place":
+        stmt = select(CashierStat.place, null(), total).group_by(CashierStat.place)
+    else:
+        stmt = (
+            select(CashierStat.marked_by, Admin.full_name, total)
+            .join(Admin, Admin.telegram_id == CashierStat.marked_by, isouter=True)
+            .group_by(CashierStat.marked_by, Admin.full_name)
+        )
+    result = await session.execute(
+        stmt.where(CashierStat.day >= start, CashierStat.day < end).order_by(total.desc())
+    )
+    return result.all()